@@ -8,57 +8,86 @@ Versão: 1.0.0
 """
 
 import os
+import re
 import sys
 import json
 import time
+import zlib
+import sqlite3
+import hashlib
+import atexit
+import argparse
+import importlib
+import importlib.util
+import queue
+import socket
+import tempfile
 import threading
+import unicodedata
+import inspect
 import subprocess
 from datetime import datetime
-from typing import Optional, Dict, List, Union
-import yt_dlp
-from yaspin import yaspin
-from mutagen.easyid3 import EasyID3
-from mutagen.id3 import ID3, APIC
-import requests
-from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Optional, Dict, List, Union
+from urllib.parse import urlparse, parse_qs
+try:
+    import importlib.metadata as importlib_metadata
+except ImportError:  # Python 3.7
+    importlib_metadata = None
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait as wait_futures
 import shutil
-from rich.console import Console
+from rich.console import Console, Group
 from rich.panel import Panel
 from rich.text import Text
 from rich import print as rprint
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
 import glob
-import questionary
-from questionary import Style
 
-# Limpa o arquivo de log na inicialização do programa
-LOG_FILE_PATH = "/sdcard/Yt-dlp/log.txt"
-try:
-    os.makedirs("/sdcard/Yt-dlp", exist_ok=True)
-    with open(LOG_FILE_PATH, "w", encoding="utf-8") as f:
-        f.write("")  # Limpa o conteúdo do arquivo
-except Exception as e:
-    # Se não for possível limpar o log, mostra aviso mas continua a execução
-    print(f"Aviso: Não foi possível limpar o arquivo de log: {e}")
+class _LazyModule:
+    """
+    Adia a importação de um módulo até o primeiro acesso a um de seus atributos.
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# Módulos pesados são importados no primeiro uso: yt_dlp quando uma extração ou download
+# começa, requests na validação de cookies e na atualização do script
+yt_dlp = _LazyModule("yt_dlp")
+requests = _LazyModule("requests")
+http_cookiejar = _LazyModule("http.cookiejar")
+mutagen = _LazyModule("mutagen")
+rich_progress = _LazyModule("rich.progress")
+rich_live = _LazyModule("rich.live")
+rich_table = _LazyModule("rich.table")
+# Importado só pelos menus interativos; o modo de linha de comando nunca o carrega
+questionary = _LazyModule("questionary")
 
 VERSION = "1.0.0"
 AUTHOR = "Reyzn24"
 LAST_UPDATED = "2025-06-07 00:17:00"
 
-HISTORY_FILE_ONLINE = "/sdcard/Yt-dlp/history_online.json"
-
-custom_style = Style([
-    ('qmark', 'fg:#673ab7 bold'),     # Estilo para o símbolo de pergunta
-    ('question', 'bold'),             # Estilo para o texto da pergunta
-    ('answer', 'fg:#f44336 bold'),    # Estilo para a resposta
-    ('pointer', 'fg:#673ab7 bold'),   # Estilo para o indicador de seleção
-    ('highlighted', 'fg:#673ab7 bold'), # Estilo para itens destacados
-    ('selected', 'fg:#cc5454'),       # Estilo para itens selecionados
-    ('separator', 'fg:#673ab7'),      # Estilo para separadores
-    ('instruction', 'fg:#535353'),    # Estilo para instruções
-    ('text', ''),                     # Estilo para texto normal
-    ('disabled', 'fg:#858585 italic') # Estilo para itens desabilitados
-])
+HISTORY_FILE_ONLINE = "/sdcard/Yt-dlp/history_online.jsonl"
+HISTORY_FILE_ONLINE_LEGACY = "/sdcard/Yt-dlp/history_online.json"
+
+@lru_cache(maxsize=None)
+def custom_style():
+    return questionary.Style([
+        ('qmark', 'fg:#673ab7 bold'),     # Estilo para o símbolo de pergunta
+        ('question', 'bold'),             # Estilo para o texto da pergunta
+        ('answer', 'fg:#f44336 bold'),    # Estilo para a resposta
+        ('pointer', 'fg:#673ab7 bold'),   # Estilo para o indicador de seleção
+        ('highlighted', 'fg:#673ab7 bold'), # Estilo para itens destacados
+        ('selected', 'fg:#cc5454'),       # Estilo para itens selecionados
+        ('separator', 'fg:#673ab7'),      # Estilo para separadores
+        ('instruction', 'fg:#535353'),    # Estilo para instruções
+        ('text', ''),                     # Estilo para texto normal
+        ('disabled', 'fg:#858585 italic') # Estilo para itens desabilitados
+    ])
 
 console = Console()
 
@@ -81,27 +110,157 @@ def cleanup_temp_files(directory, base_filename):
                 print(f"Error removing temporary file {file}: {str(e)}")
 
 class Logger:
-    def __init__(self, log_file: str):
+    """
+    Logger com fila: log() apenas enfileira a entrada e uma thread de escrita grava as
+    entradas em lote, mantendo o arquivo aberto. O arquivo é rotacionado por tamanho ou idade,
+    guardando até backup_count arquivos antigos (log.txt.1, log.txt.2, ...).
+    """
+    LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+    def __init__(self, log_file: str, level: str = "INFO", json_format: bool = False,
+                 max_bytes: int = 1024 * 1024, max_age_days: float = 7, backup_count: int = 3):
         self.log_file = log_file
         self.console = Console()
+        self.configure(level, json_format, max_bytes, max_age_days, backup_count)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._file = None
+        self._file_size = 0
+        self._file_started_at = None
+    def configure(self, level: str = "INFO", json_format: bool = False,
+                  max_bytes: int = 1024 * 1024, max_age_days: float = 7, backup_count: int = 3):
+        self.level = self.LEVELS.get(str(level).upper(), self.LEVELS["INFO"])
+        self.json_format = json_format
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.backup_count = max(0, int(backup_count))
     def log(self, message: str, level: str = "INFO", context: str = None, exc: Exception = None):
         """
         Log a message with optional context and exception details.
         """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         ctx = f"[{context}]" if context else ""
         exc_msg = f" | Exception: {exc}" if exc else ""
-        log_entry = f"[{timestamp}] [{level}]{ctx} {message}{exc_msg}\n"
+        if self.LEVELS.get(level, self.LEVELS["INFO"]) >= self.level:
+            if self.json_format:
+                entry = {"time": datetime.now().isoformat(timespec="seconds"), "level": level, "message": message}
+                if context:
+                    entry["context"] = context
+                if exc:
+                    entry["exception"] = f"{type(exc).__name__}: {exc}"
+                log_entry = json.dumps(entry, ensure_ascii=False) + "\n"
+            else:
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                log_entry = f"[{timestamp}] [{level}]{ctx} {message}{exc_msg}\n"
+            self._ensure_writer()
+            self._queue.put(log_entry)
+        if level in ["ERROR", "WARNING"]:
+            style = "bold red" if level == "ERROR" else "bold yellow"
+            self.console.print(f"\n[{style}]{level}:[/] {ctx} {message}{exc_msg}")
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, name="logger", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+    def _writer(self):
+        while True:
+            entry = self._queue.get()
+            batch = []
+            stop = entry is None
+            if not stop:
+                batch.append(entry)
+            # Agrupa tudo o que já estiver na fila em uma única escrita
+            while not stop and len(batch) < 500:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+            if batch:
+                self._write_batch(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                self._close_file()
+                return
+    def _write_batch(self, entries: List[str]):
+        pending = []
         try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(log_entry)
+            if self._file is None:
+                self._open_file()
+            for entry in entries:
+                size = len(entry.encode("utf-8"))
+                if self._should_rotate(size):
+                    self._file.write("".join(pending))
+                    pending = []
+                    self._rotate()
+                pending.append(entry)
+                self._file_size += size
+            self._file.write("".join(pending))
+            self._file.flush()
         except Exception as log_exc:
             # Exibe erro no console caso não consiga escrever no arquivo de log
             self.console.print(f"[bold red]ERRO DE LOG:[/] Não foi possível escrever no arquivo: {log_exc}")
-            self.console.print(f"[bold red]ENTRADA PERDIDA:[/] {log_entry.strip()}")
-        if level in ["ERROR", "WARNING"]:
-            style = "bold red" if level == "ERROR" else "bold yellow"
-            self.console.print(f"\n[{style}]{level}:[/] {ctx} {message}{exc_msg}")
+            self.console.print(f"[bold red]ENTRADAS PERDIDAS:[/] {''.join(pending).strip()}")
+            self._close_file()
+    def _open_file(self):
+        self._file = open(self.log_file, "a", encoding="utf-8")
+        self._file_size = self._file.tell()
+        self._file_started_at = self._read_first_timestamp() if self._file_size else time.time()
+    def _read_first_timestamp(self):
+        """
+        Data da primeira entrada do arquivo atual, usada na rotação por idade.
+        """
+        try:
+            with open(self.log_file, "r", encoding="utf-8") as f:
+                first = f.readline().strip()
+            if first.startswith("{"):
+                stamp = json.loads(first)["time"]
+                return datetime.fromisoformat(stamp).timestamp()
+            return datetime.strptime(first[1:20], "%Y-%m-%d %H:%M:%S").timestamp()
+        except Exception:
+            return os.path.getmtime(self.log_file)
+    def _should_rotate(self, incoming: int) -> bool:
+        if not self._file_size:
+            return False
+        if self.max_bytes and self._file_size + incoming > self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self._file_started_at > self.max_age
+    def _rotate(self):
+        self._close_file()
+        if self.backup_count:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.log_file}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.log_file}.{index + 1}")
+            os.replace(self.log_file, f"{self.log_file}.1")
+        else:
+            os.remove(self.log_file)
+        self._file = open(self.log_file, "a", encoding="utf-8")
+        self._file_size = 0
+        self._file_started_at = time.time()
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+    def flush(self):
+        """
+        Aguarda a gravação de todas as entradas enfileiradas.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
 
 class DownloaderConfig:
     def __init__(self):
@@ -127,9 +286,25 @@ class DownloaderConfig:
         self.theme_color = "cyan"
         self.notification_sound = True
         self.notification_sound_file = "/system/media/audio/ui/Effect_Tick.ogg"  # Som de notificação padrão
+        self.metadata_cache_ttl_hours = 24  # 0 desativa o cache de metadados
+        self.metadata_cache_max_mb = 50
+        self.stream_cache_max_mb = 200  # 0 desativa o cache de áudio online
+        self.log_level = "INFO"
+        self.log_format = "text"  # "text" ou "json" (uma entrada JSON por linha)
+        self.log_max_mb = 1
+        self.log_max_age_days = 7
+        self.log_backup_count = 3
+        self.history_retention = 50  # 0 = sem limite
+        self.metrics_enabled = True  # tempos por fase de cada download em metrics.jsonl
+        self.metrics_prometheus_file = ""  # arquivo .prom para o textfile collector do node_exporter
         self.logger = Logger(self.log_file)
         self.create_base_dirs()
         self.load_config()
+        self.cookies = CookieStore(self)
+        self.cookie_validator = CookieValidator(self)
+        self.history = OnlineHistory(
+            HISTORY_FILE_ONLINE, self.logger, self.history_retention, legacy_path=HISTORY_FILE_ONLINE_LEGACY
+        )
     def set_max_concurrent_downloads(self, value: int):
             """
             Define o número máximo de downloads simultâneos, garantindo que esteja dentro de um intervalo válido.
@@ -154,7 +329,18 @@ class DownloaderConfig:
             'proxy_url': '',
             'theme_color': 'cyan',
             'notification_sound': True,
-            'notification_sound_file': "/system/media/audio/ui/Effect_Tick.ogg"
+            'notification_sound_file': "/system/media/audio/ui/Effect_Tick.ogg",
+            'metadata_cache_ttl_hours': 24,
+            'metadata_cache_max_mb': 50,
+            'stream_cache_max_mb': 200,
+            'log_level': 'INFO',
+            'log_format': 'text',
+            'log_max_mb': 1,
+            'log_max_age_days': 7,
+            'log_backup_count': 3,
+            'history_retention': 50,
+            'metrics_enabled': True,
+            'metrics_prometheus_file': ''
         }
         try:
             if os.path.exists(self.config_file):
@@ -172,6 +358,15 @@ class DownloaderConfig:
                 self.logger.log("Novo arquivo de configuração criado com valores padrão", context="Config")
         except Exception as e:
             self.logger.log(f"Erro ao carregar configuração: {str(e)}", "ERROR", context="Config", exc=e)
+        self.apply_log_settings()
+    def apply_log_settings(self):
+        self.logger.configure(
+            level=self.log_level,
+            json_format=self.log_format == "json",
+            max_bytes=int(float(self.log_max_mb) * 1024 * 1024),
+            max_age_days=self.log_max_age_days,
+            backup_count=self.log_backup_count
+        )
     def save_config(self):
         config = {
             'audio_path': self.audio_path,
@@ -188,7 +383,18 @@ class DownloaderConfig:
             'proxy_url': self.proxy_url,
             'theme_color': self.theme_color,
             'notification_sound': self.notification_sound,
-            'notification_sound_file': self.notification_sound_file
+            'notification_sound_file': self.notification_sound_file,
+            'metadata_cache_ttl_hours': self.metadata_cache_ttl_hours,
+            'metadata_cache_max_mb': self.metadata_cache_max_mb,
+            'stream_cache_max_mb': self.stream_cache_max_mb,
+            'log_level': self.log_level,
+            'log_format': self.log_format,
+            'log_max_mb': self.log_max_mb,
+            'log_max_age_days': self.log_max_age_days,
+            'log_backup_count': self.log_backup_count,
+            'history_retention': self.history_retention,
+            'metrics_enabled': self.metrics_enabled,
+            'metrics_prometheus_file': self.metrics_prometheus_file
         }
         try:
             with open(self.config_file, 'w') as f:
@@ -222,7 +428,7 @@ class DownloaderConfig:
                     {"name": "Histórico", "value": "history"},
                     {"name": "Salvar e Voltar", "value": "save"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "save":
                 self.save_config()
@@ -265,7 +471,7 @@ class DownloaderConfig:
                     {"name": "Pasta de Vídeo", "value": "video_path"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "back":
                 break
@@ -273,7 +479,7 @@ class DownloaderConfig:
                 path = questionary.text(
                     f"Digite o novo caminho para downloads de áudio (atualmente: {self.audio_path}):",
                     default=self.audio_path,
-                    style=custom_style
+                    style=custom_style()
                 ).ask()
                 if path:
                     self.audio_path = path
@@ -281,7 +487,7 @@ class DownloaderConfig:
                 path = questionary.text(
                     f"Digite o novo caminho para downloads de vídeo (atualmente: {self.video_path}):",
                     default=self.video_path,
-                    style=custom_style
+                    style=custom_style()
                 ).ask()
                 if path:
                     self.video_path = path
@@ -305,7 +511,7 @@ class DownloaderConfig:
                     {"name": "Qualidade de Vídeo", "value": "video_quality"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "back":
                 break
@@ -333,9 +539,11 @@ class DownloaderConfig:
                     {"name": f"Idiomas de Legendas ({', '.join(self.subtitle_languages)})", "value": "sub_languages"},
                     {"name": "Downloads Simultâneos", "value": "concurrent"},
                     {"name": "Criar Subpastas", "value": "subfolders"},
+                    {"name": f"Cache de Metadados ({self.metadata_cache_ttl_hours}h, {self.metadata_cache_max_mb} MB)", "value": "metadata_cache"},
+                    {"name": f"Cache de Áudio Online ({self.stream_cache_max_mb or 'desativado'}{' MB' if self.stream_cache_max_mb else ''})", "value": "stream_cache"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "back":
                 break
@@ -352,7 +560,7 @@ class DownloaderConfig:
             f"Escolha a cor do tema (atualmente: {self.theme_color}):",
             choices=["cyan", "green", "yellow", "blue", "magenta", "red"],
             default=self.theme_color,
-            style=custom_style
+            style=custom_style()
         ).ask()
         if theme_choice:
             self.theme_color = theme_choice
@@ -367,7 +575,7 @@ class DownloaderConfig:
         proxy = questionary.text(
             f"URL do Proxy (deixe em branco para desativar) (atualmente: {self.proxy_url or 'desativado'}):",
             default=self.proxy_url,
-            style=custom_style
+            style=custom_style()
         ).ask()
         self.proxy_url = proxy
     def _submenu_general(self):
@@ -387,9 +595,12 @@ class DownloaderConfig:
                 choices=[
                     {"name": "Excluir Arquivos Temporários", "value": "auto_delete"},
                     {"name": "Som de Notificação", "value": "notification"},
+                    {"name": f"Log ({self.log_level}, {self.log_format}, {self.log_max_mb} MB x {self.log_backup_count})", "value": "log"},
+                    {"name": f"Limite do Histórico ({self.history_retention or 'sem limite'})", "value": "history_retention"},
+                    {"name": f"Métricas de Download ({'ON' if self.metrics_enabled else 'OFF'}{', Prometheus' if self.metrics_prometheus_file else ''})", "value": "metrics"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "back":
                 break
@@ -410,7 +621,7 @@ class DownloaderConfig:
                     {"name": "Escolher arquivo de som para notificação", "value": "choose"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "back":
                 break
@@ -421,7 +632,7 @@ class DownloaderConfig:
                         {"name": "Sim", "value": True},
                         {"name": "Não", "value": False}
                     ],
-                    style=custom_style
+                    style=custom_style()
                 ).ask()
             elif choice == "choose":
                 default_sounds = [
@@ -435,7 +646,7 @@ class DownloaderConfig:
                 sound_file = questionary.text(
                     "Digite o caminho para o arquivo de som de notificação:",
                     default=self.notification_sound_file,
-                    style=custom_style,
+                    style=custom_style(),
                     qmark="🎵"
                 ).ask()
                 if sound_file and os.path.exists(sound_file):
@@ -451,7 +662,7 @@ class DownloaderConfig:
                 f"Escolha o formato de áudio padrão (atualmente: {self.default_audio_format}):",
                 choices=["mp3", "aac", "m4a", "opus", "vorbis"],
                 default=self.default_audio_format,
-                style=custom_style
+                style=custom_style()
             ).ask()
             if format_choice:
                 self.default_audio_format = format_choice
@@ -460,7 +671,7 @@ class DownloaderConfig:
                 f"Escolha o formato de vídeo padrão (atualmente: {self.default_video_format}):",
                 choices=["mp4", "mkv", "webm"],
                 default=self.default_video_format,
-                style=custom_style
+                style=custom_style()
             ).ask()
             if format_choice:
                 self.default_video_format = format_choice
@@ -469,7 +680,7 @@ class DownloaderConfig:
                 f"Escolha a qualidade de áudio padrão (atualmente: {self.default_audio_quality}):",
                 choices=["320kb", "192kb", "128kb", "96kb"],
                 default=self.default_audio_quality,
-                style=custom_style
+                style=custom_style()
             ).ask()
             if quality_choice:
                 self.default_audio_quality = quality_choice
@@ -478,7 +689,7 @@ class DownloaderConfig:
                 f"Escolha a qualidade de vídeo padrão (atualmente: {self.default_video_quality}):",
                 choices=["best", "1080p", "720p", "480p", "360p"],
                 default=self.default_video_quality,
-                style=custom_style
+                style=custom_style()
             ).ask()
             if quality_choice:
                 self.default_video_quality = quality_choice
@@ -490,7 +701,7 @@ class DownloaderConfig:
                     {"name": "Sim", "value": True},
                     {"name": "Não", "value": False}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
         elif choice == "subtitles":
             status = "ON" if self.download_subtitles else "OFF"
@@ -500,7 +711,7 @@ class DownloaderConfig:
                     {"name": "Sim", "value": True},
                     {"name": "Não", "value": False}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
         elif choice == "subfolders":
             status = "ON" if self.create_subfolders else "OFF"
@@ -510,7 +721,7 @@ class DownloaderConfig:
                     {"name": "Sim", "value": True},
                     {"name": "Não", "value": False}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
         elif choice == "concurrent":
             # Configura o número de downloads simultâneos
@@ -521,7 +732,7 @@ class DownloaderConfig:
                 f"Número máximo de downloads simultâneos (atualmente: {self.max_concurrent_downloads}):",
                 choices=choices_list,
                 default=matching_choice,
-                style=custom_style
+                style=custom_style()
             ).ask()
             if max_downloads:
                 self.set_max_concurrent_downloads(max_downloads)
@@ -533,14 +744,113 @@ class DownloaderConfig:
                     {"name": "Sim", "value": True},
                     {"name": "Não", "value": False}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
+        elif choice == "metadata_cache":
+            ttl_choice = questionary.select(
+                f"Validade do cache de metadados (atualmente: {self.metadata_cache_ttl_hours}h):",
+                choices=[
+                    {"name": "Desativado", "value": 0},
+                    {"name": "1 hora", "value": 1},
+                    {"name": "24 horas", "value": 24},
+                    {"name": "7 dias", "value": 168},
+                    {"name": "30 dias", "value": 720}
+                ],
+                style=custom_style()
+            ).ask()
+            if ttl_choice is not None:
+                self.metadata_cache_ttl_hours = ttl_choice
+            size_choice = questionary.select(
+                f"Tamanho máximo do cache de metadados (atualmente: {self.metadata_cache_max_mb} MB):",
+                choices=[{"name": f"{mb} MB", "value": mb} for mb in (10, 50, 100, 250)],
+                style=custom_style()
+            ).ask()
+            if size_choice:
+                self.metadata_cache_max_mb = size_choice
+        elif choice == "stream_cache":
+            size_choice = questionary.select(
+                f"Espaço para guardar as músicas tocadas online (atualmente: {self.stream_cache_max_mb} MB):",
+                choices=[{"name": "Desativado", "value": 0}] +
+                        [{"name": f"{mb} MB", "value": mb} for mb in (100, 200, 500, 1000)],
+                style=custom_style()
+            ).ask()
+            if size_choice is not None:
+                self.stream_cache_max_mb = size_choice
+        elif choice == "log":
+            level_choice = questionary.select(
+                f"Nível mínimo registrado no log (atualmente: {self.log_level}):",
+                choices=list(Logger.LEVELS),
+                default=self.log_level,
+                style=custom_style()
+            ).ask()
+            if level_choice:
+                self.log_level = level_choice
+            format_choice = questionary.select(
+                f"Formato do log (atualmente: {self.log_format}):",
+                choices=[
+                    {"name": "Texto", "value": "text"},
+                    {"name": "JSON (uma entrada por linha)", "value": "json"}
+                ],
+                style=custom_style()
+            ).ask()
+            if format_choice:
+                self.log_format = format_choice
+            size_choice = questionary.select(
+                f"Tamanho máximo de cada arquivo de log (atualmente: {self.log_max_mb} MB):",
+                choices=[{"name": f"{mb} MB", "value": mb} for mb in (1, 5, 10, 50)],
+                style=custom_style()
+            ).ask()
+            if size_choice:
+                self.log_max_mb = size_choice
+            backup_choice = questionary.select(
+                f"Quantos arquivos de log antigos manter (atualmente: {self.log_backup_count}):",
+                choices=[{"name": str(n), "value": n} for n in (0, 1, 3, 5, 10)],
+                style=custom_style()
+            ).ask()
+            if backup_choice is not None:
+                self.log_backup_count = backup_choice
+            self.apply_log_settings()
+        elif choice == "history_retention":
+            retention_choice = questionary.select(
+                f"Quantas músicas manter no histórico online (atualmente: {self.history_retention or 'sem limite'}):",
+                choices=[{"name": str(n), "value": n} for n in (50, 200, 1000, 10000)] + [{"name": "Sem limite", "value": 0}],
+                style=custom_style()
+            ).ask()
+            if retention_choice is not None:
+                self.history_retention = retention_choice
+                self.history.retention = retention_choice
+                self.history.compact()
+        elif choice == "metrics":
+            enabled_choice = questionary.select(
+                "Registrar o tempo de cada fase dos downloads em metrics.jsonl?",
+                choices=[
+                    {"name": "Sim", "value": True},
+                    {"name": "Não", "value": False}
+                ],
+                style=custom_style()
+            ).ask()
+            if enabled_choice is not None:
+                self.metrics_enabled = enabled_choice
+            prom_path = questionary.text(
+                "Arquivo .prom para o Prometheus (node_exporter textfile; vazio desativa):",
+                default=self.metrics_prometheus_file,
+                style=custom_style()
+            ).ask()
+            if prom_path is not None:
+                prom_path = prom_path.strip()
+                if prom_path:
+                    valid, msg = validate_path(os.path.dirname(os.path.abspath(os.path.expanduser(prom_path))), write=True, context="Métricas")
+                    if not valid:
+                        console.print(f"[red]{msg}[/]")
+                        time.sleep(2)
+                        prom_path = self.metrics_prometheus_file
+                self.metrics_prometheus_file = prom_path
         elif choice == "sub_languages":
             current = ", ".join(self.subtitle_languages)
             new_langs = questionary.text(
                 f"Digite os idiomas de legendas (separados por vírgula, ex: pt,en,es) (atualmente: {current}):",
                 default=current,
-                style=custom_style
+                style=custom_style()
             ).ask()
             if new_langs is not None:
                 langs = [lang.strip() for lang in new_langs.split(",") if lang.strip()]
@@ -549,69 +859,49 @@ class DownloaderConfig:
     def history_menu(self):
         # Gerencia o histórico de downloads online
         clear_screen()
-        history = []
-        
         console.print(Panel.fit(
             f"[bold {self.theme_color}]Histórico de Downloads[/]\n" +
             f"[bold {self.theme_color}]Gerenciamento de Itens Baixados Anteriormente[/]",
             border_style=self.theme_color
         ))
         
-        if os.path.exists(HISTORY_FILE_ONLINE):
-            with open(HISTORY_FILE_ONLINE, "r", encoding="utf-8") as f:
-                try:
-                    entries = json.load(f)
-                except Exception:
-                    entries = []
-                seen = set()
-                for item in reversed(entries):
-                    key = (item.get("title"), item.get("url"))
-                    if key not in seen:
-                        history.append(item)
-                        seen.add(key)
-                history = list(reversed(history))
-        if not history:
+        if not self.history.entries():
             console.print("[yellow]Histórico vazio.[/]")
             time.sleep(2)
             return
-        # Adiciona opção "Voltar" apenas para sair, não para exclusão
-        choices = [{"name": f'{item.get("title")}', "value": (item.get("title"), item.get("url"))} for item in history]
-        choices.append({"name": "Voltar", "value": "back"})
-        to_delete = questionary.checkbox(
-            "Selecione músicas do histórico para excluir (use espaço para selecionar, Enter para confirmar):",
-            choices=choices,
-            style=custom_style
-        ).ask()
-        # Remove a opção "back" do conjunto de exclusão, se selecionada
+        to_delete = pick_from_history(self.history, "Selecione músicas do histórico para excluir", multiple=True)
         if to_delete:
-            to_delete_set = set([x for x in to_delete if x != "back"])
-            if not to_delete_set:
-                return
-            new_lines = [item for item in history if (item.get("title"), item.get("url")) not in to_delete_set]
-            with open(HISTORY_FILE_ONLINE, "w", encoding="utf-8") as f:
-                json.dump(new_lines, f, ensure_ascii=False, indent=2)
+            self.history.remove(OnlineHistory.entry_key(item) for item in to_delete)
             console.print("[green]Histórico atualizado![/]")
             time.sleep(2)
 
     # INÍCIO - GERENCIAMENTO DE COOKIES
+    def _cookie_status_text(self, status):
+        if status is None:
+            return "verificando..."
+        return "Válido" if status else "Inválido"
     def cookies_menu(self):
+        validator = self.cookie_validator
         while True:
             clear_screen()
-            # Verifica a validade dos cookies para exibição no painel
-            tiktok_valid = self._validate_tiktok_cookie()
-            x_valid = self._validate_x_cookie()
-            tiktok_status = "[green]Válido[/]" if tiktok_valid else "[red]Inválido[/]"
-            x_status = "[green]Válido[/]" if x_valid else "[red]Inválido[/]"
-            
             console.print(Panel.fit(
                 f"[bold {self.theme_color}]Configurações de Cookies[/]\n" +
-                f"[bold {self.theme_color}]TikTok: {tiktok_status} | X/Twitter: {x_status}[/]",
+                f"[bold {self.theme_color}]Cookies de sessão usados nos downloads de sites restritos[/]",
                 border_style=self.theme_color
             ))
-            choice = questionary.select(
+            # O menu aparece na hora; os status são preenchidos conforme as validações terminam
+            statuses = {site: validator.cached_status(site) for site in validator.SITES}
+            status_choice = questionary.Choice(title="", value="validate")
+            def render_status():
+                status_choice.title = "Validar Cookies (" + " | ".join(
+                    f"{validator.SITES[site]['label']}: {self._cookie_status_text(status)}"
+                    for site, status in statuses.items()
+                ) + ")"
+            render_status()
+            question = questionary.select(
                 "Escolha uma opção:",
                 choices=[
-                    {"name": "Validar Cookies", "value": "validate"},
+                    status_choice,
                     {"name": "Mostrar Expiração de Cookies", "value": "show_exp"},
                     {"name": "Substituir/Atualizar Cookies", "value": "replace"},
                     {"name": "Mostrar Caminho do Arquivo de Cookies", "value": "show_path"},
@@ -620,8 +910,14 @@ class DownloaderConfig:
                     {"name": "Excluir Cookies", "value": "delete"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
-            ).ask()
+                style=custom_style()
+            )
+            def on_result(site, valid):
+                statuses[site] = valid
+                render_status()
+                question.application.invalidate()
+            validator.check_async([site for site, status in statuses.items() if status is None], callback=on_result)
+            choice = question.ask()
             if choice == "validate":
                 self.validate_cookies()
             elif choice == "show_exp":
@@ -639,64 +935,24 @@ class DownloaderConfig:
             elif choice == "back":
                 break
     def validate_cookies(self):
-        tiktok_valid = self._validate_tiktok_cookie()
-        x_valid = self._validate_x_cookie()
+        futures = self.cookie_validator.check_async(force=True)
+        tiktok_valid = futures['tiktok'].result()
+        x_valid = futures['x'].result()
         status = []
         status.append(f"TikTok: [green]Válido[/]" if tiktok_valid else "TikTok: [red]Inválido ou expirado[/]")
         status.append(f"X/Twitter: [green]Válido[/]" if x_valid else "X/Twitter: [red]Inválido ou expirado[/]")
         console.print("\n".join([f" - {s}" for s in status]))
         input("Pressione Enter para continuar...")
     def _validate_tiktok_cookie(self):
-        cookies = self._read_cookies_file()
-        sessionid = None
-        for c in cookies:
-            if c.get("domain", "").endswith("tiktok.com") and c.get("name") == "sessionid":
-                sessionid = c["value"]
-                break
-        if not sessionid:
-            return False
-        try:
-            resp = requests.get(
-                "https://www.tiktok.com/api/me/",
-                cookies={"sessionid": sessionid},
-                headers={"User-Agent": "Mozilla/5.0"},
-                timeout=10
-            )
-            if resp.status_code == 200 and '"user"' in resp.text:
-                return True
-        except Exception:
-            pass
-        return False
+        return self.cookie_validator.check('tiktok')
     def _validate_x_cookie(self):
-        cookies = self._read_cookies_file()
-        auth_token = None
-        for c in cookies:
-            if c.get("domain", "").endswith("twitter.com") and c.get("name") == "auth_token":
-                auth_token = c["value"]
-                break
-        if not auth_token:
-            return False
-        try:
-            resp = requests.get(
-                "https://twitter.com/home",
-                cookies={"auth_token": auth_token},
-                headers={"User-Agent": "Mozilla/5.0"},
-                timeout=10
-            )
-            if resp.status_code == 200 and "twitter.com" in resp.url:
-                return True
-        except Exception:
-            pass
-        return False
+        return self.cookie_validator.check('x')
     def show_cookie_expiration(self):
-        cookies = self._read_cookies_file()
-        found = False
-        for c in cookies:
-            if "expiry" in c:
-                exp = datetime.utcfromtimestamp(int(c["expiry"])).strftime("%Y-%m-%d %H:%M:%S")
-                console.print(f"{c.get('domain','?')}: [bold]{c.get('name','?')}[/] expires at [bold {self.theme_color}]{exp}[/]")
-                found = True
-        if not found:
+        expirations = self.cookies.expirations()
+        for expires, domain, name in expirations:
+            exp = datetime.utcfromtimestamp(expires).strftime("%Y-%m-%d %H:%M:%S")
+            console.print(f"{domain or '?'}: [bold]{name or '?'}[/] expires at [bold {self.theme_color}]{exp}[/]")
+        if not expirations:
             console.print("[yellow]Nenhuma informação de expiração encontrada no arquivo de cookies.[/]")
         input("Pressione Enter para continuar...")
     def replace_cookies(self):
@@ -723,7 +979,7 @@ class DownloaderConfig:
         export_path = questionary.text(
             "Digite o caminho de exportação (ex: /sdcard/Yt-dlp/cookies_backup.json):",
             default="/sdcard/Yt-dlp/cookies_backup.json",
-            style=custom_style).ask()
+            style=custom_style()).ask()
         ok, msg = validate_path(os.path.dirname(export_path), must_exist=True, write=True, context="ExportCookies")
         if not ok:
             console.print(Panel(f"[red]Erro: {msg}[/]", title="Erro de Exportação", border_style="red"))
@@ -739,7 +995,7 @@ class DownloaderConfig:
     def import_cookies(self):
         import_path = questionary.text(
             "Digite o caminho de importação:",
-            style=custom_style).ask()
+            style=custom_style()).ask()
         ok, msg = validate_path(import_path, must_exist=True, write=False, context="ImportCookies")
         if not ok:
             console.print(Panel(f"[red]Erro: {msg}[/]", title="Erro de Importação", border_style="red"))
@@ -763,21 +1019,294 @@ class DownloaderConfig:
                 {"name": "Sim", "value": True},
                 {"name": "Não", "value": False}
             ],
-            style=custom_style).ask()
+            style=custom_style()).ask()
         if confirm:
             os.remove(self.cookie_file)
             console.print("[green]Cookies excluídos.[/]")
         input("Pressione Enter para continuar...")
-    def _read_cookies_file(self):
-        try:
-            if os.path.exists(self.cookie_file):
-                with open(self.cookie_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
-        except Exception:
-            pass
-        return []
     #  FIM - GERENCIAMENTO DE COOKIES
 
+class CookieStore:
+    """
+    Cookies do cookies.txt (array JSON do navegador/extensão ou arquivo Netscape)
+    lidos uma única vez para um CookieJar em memória, recarregado só quando o arquivo muda.
+    Para o yt-dlp, que só aceita o formato Netscape, o jar é gravado em cookies_netscape.txt
+    uma vez por alteração. Cookies ficam indexados por domínio e por data de expiração.
+    """
+    def __init__(self, config: "DownloaderConfig"):
+        self.config = config
+        self.logger = config.logger
+        self.path = config.cookie_file
+        self.netscape_path = f"{config.base_dir}/cookies_netscape.txt"
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._netscape_stamp = None  # _stamp do cookies.txt que gerou o cookies_netscape.txt
+        self._jar = None
+        self._is_netscape = False
+        self._by_domain = {}   # sufixo do domínio -> {nome: cookie}
+        self._expiries = []    # [(expiração, domínio, nome)] em ordem crescente
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _make_cookie(name, value, domain, path="/", secure=False, expires=None, http_only=False):
+        domain = domain or ""
+        return http_cookiejar.Cookie(
+            version=0, name=name, value=value or "",
+            port=None, port_specified=False,
+            domain=domain, domain_specified=bool(domain), domain_initial_dot=domain.startswith("."),
+            path=path or "/", path_specified=True,
+            secure=bool(secure), expires=int(expires) if expires else None,
+            discard=not expires, comment=None, comment_url=None,
+            rest={"HttpOnly": None} if http_only else {}
+        )
+
+    def _parse_json(self, data) -> list:
+        cookies = []
+        for c in data if isinstance(data, list) else []:
+            if not isinstance(c, dict) or not c.get("name"):
+                continue
+            # Selenium usa "expiry", extensões do Chrome "expirationDate"
+            expires = c.get("expiry", c.get("expirationDate", c.get("expires")))
+            if c.get("session"):
+                expires = None
+            cookies.append(self._make_cookie(
+                c["name"], c.get("value"), c.get("domain"), c.get("path"),
+                c.get("secure"), expires, c.get("httpOnly")
+            ))
+        return cookies
+
+    def _parse_netscape(self, text: str) -> list:
+        cookies = []
+        for line in text.splitlines():
+            http_only = line.startswith("#HttpOnly_")
+            if http_only:
+                line = line[len("#HttpOnly_"):]
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.split("\t")
+            if len(fields) != 7:
+                continue
+            domain, _, path, secure, expires, name, value = fields
+            cookies.append(self._make_cookie(
+                name, value, domain, path, secure.upper() == "TRUE",
+                int(expires) if expires.strip().isdigit() and int(expires) > 0 else None, http_only
+            ))
+        return cookies
+
+    def _load(self):
+        stamp = self._file_stamp()
+        if self._jar is not None and stamp == self._stamp:
+            return
+        cookies = []
+        self._is_netscape = False
+        if stamp is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                if text.lstrip().startswith(("[", "{")):
+                    cookies = self._parse_json(json.loads(text))
+                else:
+                    cookies = self._parse_netscape(text)
+                    self._is_netscape = True
+            except Exception as e:
+                self.logger.log(f"Erro ao ler arquivo de cookies: {e}", "ERROR", context="Cookies", exc=e)
+        jar = http_cookiejar.MozillaCookieJar()
+        by_domain = {}
+        expiries = []
+        for cookie in cookies:
+            jar.set_cookie(cookie)
+            labels = cookie.domain.lstrip(".").lower().split(".")
+            for i in range(len(labels) - 1):
+                by_domain.setdefault(".".join(labels[i:]), {}).setdefault(cookie.name, cookie)
+            if cookie.expires:
+                expiries.append((cookie.expires, cookie.domain, cookie.name))
+        expiries.sort()
+        self._jar, self._by_domain, self._expiries, self._stamp = jar, by_domain, expiries, stamp
+
+    def jar(self):
+        with self._lock:
+            self._load()
+            return self._jar
+
+    def find(self, domain: str, name: str):
+        """
+        Cookie `name` de `domain` ou de qualquer subdomínio dele, ou None.
+        """
+        with self._lock:
+            self._load()
+            return self._by_domain.get(domain.lstrip(".").lower(), {}).get(name)
+
+    def expirations(self) -> List[tuple]:
+        """
+        [(expiração, domínio, nome)] da expiração mais próxima para a mais distante.
+        """
+        with self._lock:
+            self._load()
+            return list(self._expiries)
+
+    def netscape_file(self) -> Optional[str]:
+        """
+        Caminho de um arquivo Netscape para o cookiefile do yt-dlp, ou None sem cookies.
+        A conversão só é refeita quando o cookies.txt muda (mtime ou tamanho diferentes dos
+        da última conversão; cópias com shutil.copy2 mantêm um mtime antigo, então não
+        basta comparar as datas). O caminho é absoluto porque o yt-dlp expande "~".
+        """
+        with self._lock:
+            self._load()
+            if self._stamp is None:
+                return None
+            if self._is_netscape:
+                return os.path.abspath(self.path)
+            if self._netscape_stamp == self._stamp and os.path.exists(self.netscape_path):
+                return os.path.abspath(self.netscape_path)
+            try:
+                self._jar.save(self.netscape_path, ignore_discard=True, ignore_expires=True)
+                self._netscape_stamp = self._stamp
+            except Exception as e:
+                self.logger.log(f"Erro ao converter cookies para o formato Netscape: {e}", "ERROR", context="Cookies", exc=e)
+                return None
+            return os.path.abspath(self.netscape_path)
+
+class CookieValidator:
+    """
+    Valida os cookies de sessão (TikTok, X/Twitter) em paralelo, com uma única
+    requests.Session reaproveitada. O resultado fica em cache pelo hash do valor
+    do cookie durante `ttl` segundos (também entre execuções), então trocar o
+    cookie invalida o cache automaticamente.
+    """
+    SITES = {
+        'tiktok': {
+            'label': "TikTok",
+            'domain': "tiktok.com",
+            'cookie': "sessionid",
+            'url': "https://www.tiktok.com/api/me/",
+            'check': lambda resp: resp.status_code == 200 and '"user"' in resp.text,
+        },
+        'x': {
+            'label': "X/Twitter",
+            'domain': "twitter.com",
+            'cookie': "auth_token",
+            'url': "https://twitter.com/home",
+            'check': lambda resp: resp.status_code == 200 and "twitter.com" in resp.url,
+        },
+    }
+    ERROR_TTL = 60  # falhas de rede são tentadas de novo logo
+
+    def __init__(self, config: "DownloaderConfig", ttl: float = 1800):
+        self.config = config
+        self.logger = config.logger
+        self.ttl = ttl
+        self.cache_file = f"{config.base_dir}/.cookie_status.json"
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self._pending = {}
+        self._cache = None
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                session.headers["User-Agent"] = "Mozilla/5.0"
+                # Cookies recebidos nas respostas não devem vazar para a próxima validação
+                session.cookies.set_policy(http_cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                self._session = session
+            return self._session
+
+    def _load_cache(self):
+        if self._cache is None:
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    self._cache = json.load(f)
+            except (OSError, ValueError):
+                self._cache = {}
+        return self._cache
+
+    def _save_cache(self):
+        try:
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump(self._cache, f)
+        except OSError as e:
+            self.logger.log(f"Não foi possível salvar o cache de cookies: {e}", "WARNING", context="Cookies")
+
+    def cookie_value(self, site: str) -> Optional[str]:
+        spec = self.SITES[site]
+        cookie = self.config.cookies.find(spec['domain'], spec['cookie'])
+        return cookie.value if cookie is not None else None
+
+    def _cache_key(self, site: str, value: str) -> str:
+        return f"{site}:{hashlib.sha256(value.encode('utf-8')).hexdigest()}"
+
+    def cached_status(self, site: str) -> Optional[bool]:
+        """
+        Resultado conhecido (e ainda válido) para o cookie atual, ou None se precisa verificar.
+        Sem cookie no arquivo, retorna False sem acessar a rede.
+        """
+        value = self.cookie_value(site)
+        if not value:
+            return False
+        with self._lock:
+            entry = self._load_cache().get(self._cache_key(site, value))
+        if not entry:
+            return None
+        ttl = self.ERROR_TTL if entry.get("error") else self.ttl
+        if time.time() - entry.get("checked_at", 0) > ttl:
+            return None
+        return entry.get("valid", False)
+
+    def _probe(self, site: str, value: str) -> bool:
+        spec = self.SITES[site]
+        error = False
+        try:
+            resp = self._get_session().get(spec['url'], cookies={spec['cookie']: value}, timeout=10)
+            valid = bool(spec['check'](resp))
+        except Exception as e:
+            self.logger.log(f"Falha ao validar cookie do {spec['label']}: {e}", "DEBUG", context="Cookies")
+            valid, error = False, True
+        with self._lock:
+            self._load_cache()[self._cache_key(site, value)] = {
+                "valid": valid, "error": error, "checked_at": time.time()
+            }
+            self._save_cache()
+        return valid
+
+    def check_async(self, sites=None, callback=None, force: bool = False) -> Dict[str, Future]:
+        """
+        Inicia a validação dos sites informados (todos por padrão) sem bloquear.
+        `callback(site, válido)` é chamado quando cada resultado chega.
+        """
+        futures = {}
+        for site in sites or self.SITES:
+            value = self.cookie_value(site)
+            # Sem cookie no arquivo não há o que verificar, mesmo com force=True
+            status = False if not value else None if force else self.cached_status(site)
+            if status is not None:
+                future = Future()
+                future.set_result(status)
+            else:
+                with self._lock:
+                    future = self._pending.get(site)
+                    if future is None or future.done():
+                        if self._executor is None:
+                            self._executor = ThreadPoolExecutor(
+                                max_workers=len(self.SITES), thread_name_prefix="cookies"
+                            )
+                        future = self._executor.submit(self._probe, site, value)
+                        self._pending[site] = future
+            if callback:
+                future.add_done_callback(lambda f, site=site: callback(site, f.result()))
+            futures[site] = future
+        return futures
+
+    def check(self, site: str, force: bool = False) -> bool:
+        return self.check_async([site], force=force)[site].result()
+
 def validate_path(path: str, must_exist: bool = True, write: bool = False, context: str = "") -> (bool, str):
     """
     Valida se o caminho existe e se há permissão de leitura/escrita.
@@ -819,184 +1348,2301 @@ class DependencyManager:
             'rich': 'pip install --upgrade rich',
             'questionary': 'pip install --upgrade questionary',
             'mpv': 'pkg install -y mpv',
+            'requests': 'pip install --upgrade requests',
         }
         self.dependency_modules = {
             'yt-dlp': 'yt_dlp',
             'mutagen': 'mutagen',
             'yaspin': 'yaspin',
             'rich': 'rich',
-            'questionary': 'questionary'
+            'questionary': 'questionary',
+            'requests': 'requests'
         }
-        self.install_flag_file = "/sdcard/Yt-dlp/.deps_installed"
+        self.cache_file = "/sdcard/Yt-dlp/.deps_cache.json"
+        self.index_cache_file = "/sdcard/Yt-dlp/.pypi_cache.json"
+        self.index_cache_ttl = 6 * 3600
+        self._results = None
     def check_ffmpeg(self):
-        try:
-            result = subprocess.run(
-                ['command', '-v', 'ffmpeg'], 
-                shell=True, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE
-            )
-            return result.returncode == 0
-        except:
-            return False
+        return shutil.which('ffmpeg') is not None
     def check_mpv(self):
         """
         Verifica se o mpv está disponível no sistema.
         """
-        try:
-            result = subprocess.run(
-                ['command', '-v', 'mpv'],
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            return result.returncode == 0
-        except:
-            return False
+        return shutil.which('mpv') is not None
     def dependency_installed(self, dep):
         if dep == 'ffmpeg':
             return self.check_ffmpeg()
         elif dep == 'mpv':
             return self.check_mpv()
         elif dep in self.dependency_modules:
+            # find_spec localiza o pacote sem importá-lo
             try:
-                __import__(self.dependency_modules[dep])
-                return True
-            except ImportError:
+                return importlib.util.find_spec(self.dependency_modules[dep]) is not None
+            except (ImportError, ValueError):
                 return False
         return False
+    def _package_version(self, dep):
+        try:
+            return importlib_metadata.version(dep)
+        except Exception:
+            return None
+    def _fingerprint(self):
+        """
+        Identifica o ambiente: interpretador, PATH (com a data de modificação de cada pasta)
+        e versões dos pacotes Python. Muda quando algo é instalado, atualizado ou removido.
+        """
+        path = os.environ.get("PATH", "")
+        parts = [sys.executable, sys.version, path]
+        for directory in path.split(os.pathsep):
+            try:
+                parts.append(f"{directory}:{os.stat(directory).st_mtime_ns}")
+            except OSError:
+                parts.append(f"{directory}:-")
+        for dep in self.dependency_modules:
+            parts.append(f"{dep}=={self._package_version(dep)}")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    def _save_cache(self, fingerprint, results):
+        try:
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint, "results": results, "checked_at": time.time()}, f)
+        except OSError as e:
+            self.logger.log(f"Não foi possível salvar o cache de dependências: {e}", "WARNING", context="Dependencies")
+        # marcador antigo, substituído pelo cache com impressão digital
+        legacy_flag = os.path.join(os.path.dirname(self.cache_file), ".deps_installed")
+        if os.path.exists(legacy_flag):
+            try:
+                os.remove(legacy_flag)
+            except OSError:
+                pass
+    def probe_all(self, use_cache=True):
+        """
+        Retorna {dependência: instalada}. Usa o resultado salvo enquanto a impressão digital
+        do ambiente não mudar; nenhum subprocesso é executado.
+        """
+        fingerprint = self._fingerprint()
+        if use_cache:
+            if self._results is not None and self._results[0] == fingerprint:
+                return dict(self._results[1])
+            cache = self._load_cache()
+            results = cache.get("results")
+            if cache.get("fingerprint") == fingerprint and isinstance(results, dict) and set(results) == set(self.dependencies):
+                self._results = (fingerprint, results)
+                return dict(results)
+        importlib.invalidate_caches()
+        results = {dep: self.dependency_installed(dep) for dep in self.dependencies}
+        self._results = (fingerprint, results)
+        self._save_cache(fingerprint, results)
+        return dict(results)
     def check_all_dependencies(self):
-        for dep in self.dependencies:
-            if not self.dependency_installed(dep):
-                return False
-        return True
-    def install_dependency(self, dep, install_cmd, action="Baixando"):
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[bold {self.theme_color}]{task.description}"),
-            transient=False,
-            refresh_per_second=20,
-            console=self.console
-        ) as progress:
-            task = progress.add_task(f"{action} {dep}...", total=None)
+        return all(self.probe_all().values())
+    def _is_pip(self, dep):
+        return self.dependencies[dep].startswith("pip ")
+    def _load_index_cache(self):
+        try:
+            with open(self.index_cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    def _latest_versions(self, packages):
+        """
+        Consulta a versão mais recente de cada pacote no PyPI, em paralelo.
+        As respostas ficam em cache por index_cache_ttl segundos.
+        Retorna {pacote: versão ou None se a consulta falhar}.
+        """
+        cache = self._load_index_cache()
+        now = time.time()
+        latest = {}
+        pending = []
+        for package in packages:
+            entry = cache.get(package)
+            if isinstance(entry, dict) and now - entry.get("checked_at", 0) < self.index_cache_ttl:
+                latest[package] = entry.get("version")
+            else:
+                pending.append(package)
+        def fetch(package):
+            # urllib em vez de requests: o próprio requests pode ainda não estar instalado
+            import urllib.request
+            with urllib.request.urlopen(f"https://pypi.org/pypi/{package}/json", timeout=5) as response:
+                return json.load(response)["info"]["version"]
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+                futures = {pool.submit(fetch, package): package for package in pending}
+                for future in as_completed(futures):
+                    package = futures[future]
+                    try:
+                        latest[package] = future.result()
+                        cache[package] = {"version": latest[package], "checked_at": now}
+                    except Exception as e:
+                        latest[package] = None
+                        self.logger.log(f"Falha ao consultar a versão de {package} no PyPI: {e}", "DEBUG", context="Dependencies")
             try:
-                process = subprocess.run(
-                    install_cmd, 
-                    shell=True, 
-                    stdout=subprocess.DEVNULL, 
-                    stderr=subprocess.DEVNULL
-                )
-            except Exception as e:
-                self.logger.log(f"Falha ao {action.lower()} {dep}: {e}", "ERROR")
-            progress.remove_task(task)
-            time.sleep(0.2)
+                with open(self.index_cache_file, "w", encoding="utf-8") as f:
+                    json.dump(cache, f)
+            except OSError:
+                pass
+        return latest
+    def _run_step(self, name, cmd):
+        """
+        Executa um passo de instalação e retorna duração, código de saída e o final da saída.
+        """
+        started = time.perf_counter()
+        try:
+            process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            returncode, output = process.returncode, process.stdout or ""
+        except Exception as e:
+            returncode, output = None, str(e)
+        step = {
+            "name": name,
+            "cmd": " ".join(cmd),
+            "ok": returncode == 0,
+            "returncode": returncode,
+            "duration": time.perf_counter() - started,
+            "output": output.strip().splitlines()[-5:],
+        }
+        if step["ok"]:
+            self.logger.log(f"{name}: concluído em {step['duration']:.1f}s", context="Dependencies")
+        else:
+            self.logger.log(
+                f"{name}: falhou (código {returncode}) em {step['duration']:.1f}s | {' / '.join(step['output'])}",
+                "ERROR", context="Dependencies"
+            )
+        return step
+    def install_packages(self, deps, action="Baixando", check_latest=False):
+        """
+        Instala/atualiza as dependências informadas: todos os pacotes pip em uma única
+        chamada do pip e os pacotes do sistema (ffmpeg, mpv) em outra, executadas em paralelo.
+        Com check_latest=True, pacotes pip já na versão mais recente são ignorados.
+        """
+        pip_deps = [dep for dep in deps if self._is_pip(dep)]
+        system_deps = [dep for dep in deps if not self._is_pip(dep)]
+        skipped = []
+        if check_latest and pip_deps:
+            latest = self._latest_versions(pip_deps)
+            installed = {dep: self._package_version(dep) for dep in pip_deps}
+            skipped = [dep for dep in pip_deps if installed[dep] and installed[dep] == latest.get(dep)]
+            pip_deps = [dep for dep in pip_deps if dep not in skipped]
+        steps = []
+        if pip_deps:
+            steps.append((f"pip ({', '.join(pip_deps)})", [sys.executable, "-m", "pip", "install", "--upgrade", *pip_deps]))
+        if system_deps:
+            steps.append((f"pkg ({', '.join(system_deps)})", ["pkg", "install", "-y", *system_deps]))
+        results = []
+        if steps:
+            with rich_progress.Progress(
+                rich_progress.SpinnerColumn(),
+                rich_progress.TextColumn("[bold cyan]{task.description}"),
+                rich_progress.TimeElapsedColumn(),
+                transient=True,
+                console=self.console
+            ) as progress:
+                with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="deps") as pool:
+                    futures = {}
+                    for name, cmd in steps:
+                        task = progress.add_task(f"{action} {name}...", total=None)
+                        futures[pool.submit(self._run_step, name, cmd)] = task
+                    for future in as_completed(futures):
+                        results.append(future.result())
+                        progress.remove_task(futures[future])
+        for step in results:
+            if step["ok"]:
+                self.console.print(f"[green]✓ {step['name']}[/] [dim]{step['duration']:.1f}s[/]")
+            else:
+                self.console.print(f"[red]✗ {step['name']}[/] [dim]{step['duration']:.1f}s, código {step['returncode']}[/]")
+                for line in step["output"]:
+                    self.console.print(f"  [dim]{line}[/]")
+        if skipped:
+            self.console.print(f"[dim]Já atualizados: {', '.join(skipped)}[/]")
+        if results:
+            self.probe_all(use_cache=False)
+        return results
     def check_dependencies(self):
-        if os.path.exists(self.install_flag_file) and self.check_all_dependencies():
+        results = self.probe_all()
+        if all(results.values()):
             return
-        for dep, install_cmd in self.dependencies.items():
-            if not self.dependency_installed(dep):
-                self.install_dependency(dep, install_cmd, action="Baixando")
-                self.logger.log(f"Dependência instalada: {dep}")
-        if self.check_all_dependencies():
-            with open(self.install_flag_file, 'w') as f:
-                f.write('ok')
-        else:
+        missing = [dep for dep, installed in results.items() if not installed]
+        self.install_packages(missing, action="Baixando")
+        if not all(self.probe_all().values()):
             self.logger.log("Algumas dependências falharam na instalação.", "ERROR")
     def update_all_dependencies(self):
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[bold {self.theme_color}]{task.description}"),
-            transient=False,
-            refresh_per_second=20,
-            console=self.console
-        ) as progress:
-            task = progress.add_task("Atualizando ...", total=None)
-            for dep, install_cmd in self.dependencies.items():
-                progress.update(task, description=f"Atualizando {dep}...")
-                try:
-                    subprocess.run(
-                        install_cmd, 
-                        shell=True, 
-                        stdout=subprocess.DEVNULL, 
-                        stderr=subprocess.DEVNULL
-                    )
-                    self.logger.log(f"Dependência atualizada: {dep}")
-                except Exception as e:
-                    self.logger.log(f"Falha ao atualizar {dep}: {e}", "ERROR")
-                time.sleep(0.2)
-            progress.remove_task(task)
-            time.sleep(0.5)
+        return self.install_packages(list(self.dependencies), action="Atualizando", check_latest=True)
     def update_ytdlp(self):
         self.update_all_dependencies()
 
-class Downloader:
-    def __init__(self, config: DownloaderConfig):
+_YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)([0-9A-Za-z_-]{11})'
+)
+_url_key_cache: Dict[str, Optional[str]] = {}
+
+def url_cache_key(url: str) -> Optional[str]:
+    """
+    Obtém a chave canônica "<extrator> <id>" (mesmo formato do arquivo de download do yt-dlp)
+    a partir da URL, sem acessar a rede. Retorna None se o ID não puder ser deduzido
+    e para URLs do YouTube com list=, que o yt-dlp trata como playlist.
+    """
+    url = url.strip()
+    if url in _url_key_cache:
+        return _url_key_cache[url]
+    key = None
+    match = _YOUTUBE_ID_RE.search(url)
+    if match:
+        if 'list' not in parse_qs(urlparse(url).query):
+            key = f"youtube {match.group(1)}"
+    else:
+        try:
+            for ie in yt_dlp.extractor.gen_extractor_classes():
+                if ie.ie_key() == 'Generic':
+                    break
+                if ie.suitable(url):
+                    temp_id = ie.get_temp_id(url)
+                    if temp_id:
+                        key = f"{ie.ie_key().lower()} {temp_id}"
+                    break
+        except Exception:
+            key = None
+    _url_key_cache[url] = key
+    return key
+
+def info_cache_key(info: dict) -> Optional[str]:
+    """
+    Chave canônica "<extrator> <id>" de um info dict já extraído.
+    """
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    video_id = info.get('id')
+    if not extractor or not video_id:
+        return None
+    return f"{extractor.lower()} {video_id}"
+
+def url_expiry(url: str) -> Optional[float]:
+    """
+    Lê o parâmetro expire= (timestamp Unix) de uma URL de stream, se existir.
+    """
+    try:
+        values = parse_qs(urlparse(url).query).get('expire')
+        if not values:
+            # googlevideo também usa o formato /expire/<ts>/ no caminho
+            match = re.search(r'/expire/(\d+)', url)
+            return float(match.group(1)) if match else None
+        return float(values[0])
+    except (TypeError, ValueError):
+        return None
+
+def formats_fresh(info: dict, margin: float = 300.0, max_age: float = 1800.0) -> bool:
+    """
+    Indica se as URLs de formato de um info dict ainda podem ser usadas para download.
+    Usa o expire= das URLs quando presente; caso contrário, a idade da extração.
+    """
+    now = time.time()
+    expiries = [url_expiry(f['url']) for f in info.get('formats') or [] if f.get('url')]
+    expiries = [e for e in expiries if e]
+    if expiries:
+        return min(expiries) - margin > now
+    epoch = info.get('epoch')
+    return epoch is None or now - epoch < max_age
+
+class MetadataCache:
+    """
+    Cache persistente de info dicts do yt-dlp (título, canal, duração, formatos, thumbnails),
+    indexado por "<extrator> <id>". Os dados ficam em SQLite, comprimidos com zlib,
+    com TTL e limite de tamanho com remoção LRU.
+    """
+    def __init__(self, config: "DownloaderConfig"):
         self.config = config
         self.logger = config.logger
-        self.console = Console()
-        self.progress = None
-        self.current_task = None
-        self.download_queue: list[str] = []  # type annotation added
-        self.executor = ThreadPoolExecutor(max_workers=config.max_concurrent_downloads)
-        self.theme_color = config.theme_color
+        self.db_path = f"{config.base_dir}/metadata_cache.db"
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total_size = 0
 
-    def check_mpv(self):
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "key TEXT PRIMARY KEY, title TEXT, created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL, size INTEGER NOT NULL, data BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_metadata_accessed ON metadata(accessed_at)")
+            conn.execute("DELETE FROM metadata WHERE created_at < ?", (time.time() - self._ttl(),))
+            conn.commit()
+            self._total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM metadata").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _ttl(self) -> float:
+        return float(self.config.metadata_cache_ttl_hours) * 3600
+
+    def get(self, key: Optional[str], fresh_formats: bool = False) -> Optional[dict]:
         """
-        Verifica se o mpv está disponível no sistema.
+        Retorna o info dict em cache ou None. Com fresh_formats=True só retorna entradas
+        cujas URLs de formato ainda não expiraram.
         """
+        if not key or self.config.metadata_cache_ttl_hours <= 0:
+            return None
         try:
-            result = subprocess.run(
-                ['command', '-v', 'mpv'],
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            return result.returncode == 0
-        except:
-            return False
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT created_at, data FROM metadata WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                created_at, data = row
+                if created_at < time.time() - self._ttl():
+                    self._delete(conn, key)
+                    return None
+                conn.execute("UPDATE metadata SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+            info = json.loads(zlib.decompress(data).decode('utf-8'))
+        except Exception as e:
+            self.logger.log(f"Falha ao ler cache de metadados: {e}", "WARNING", context="MetadataCache")
+            return None
+        if fresh_formats and not formats_fresh(info):
+            return None
+        return info
 
-    def get_title_from_url(self, url):
+    def put(self, info: dict) -> Optional[str]:
         """
-        Usa yt-dlp para obter o título de um vídeo ou áudio URL sem fazer download.
+        Guarda um info dict de vídeo (não processado) e aplica o limite de tamanho.
         """
+        if self.config.metadata_cache_ttl_hours <= 0 or info.get('_type', 'video') != 'video':
+            return None
+        key = info_cache_key(info)
+        if not key:
+            return None
         try:
-            with yt_dlp.YoutubeDL({"quiet": True, "no_warnings": True}) as ydl:
-                info = ydl.extract_info(url, download=False)
-                return info.get("title", url)
-        except Exception:
-            return url
+            clean = {k: v for k, v in info.items() if not k.startswith('__')}
+            clean = yt_dlp.YoutubeDL.sanitize_info(clean)
+            data = zlib.compress(json.dumps(clean, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+            now = time.time()
+            with self._lock:
+                conn = self._connect()
+                old = conn.execute("SELECT size FROM metadata WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO metadata (key, title, created_at, accessed_at, size, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, clean.get('title'), now, now, len(data), data)
+                )
+                self._total_size += len(data) - (old[0] if old else 0)
+                self._evict(conn)
+                conn.commit()
+            return key
+        except Exception as e:
+            self.logger.log(f"Falha ao gravar cache de metadados: {e}", "WARNING", context="MetadataCache")
+            return None
 
-    def ensure_mpv(self):
-        dep_manager = DependencyManager(self.logger)
-        if not dep_manager.check_mpv():
-            dep_manager.install_dependency('mpv', dep_manager.dependencies['mpv'])
-        if not dep_manager.check_mpv():
-            console.print("[red]O mpv não está instalado e não pôde ser instalado automaticamente.[/]")
-            time.sleep(2)
-            return False
-        return True
+    def _delete(self, conn, key: str):
+        row = conn.execute("SELECT size FROM metadata WHERE key = ?", (key,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM metadata WHERE key = ?", (key,))
+            self._total_size -= row[0]
+            conn.commit()
 
-    def play_music_menu(self):
-        while True:
-            clear_screen()
-            mpv_status = "[green]Disponível[/]" if self.check_mpv() else "[red]Não Disponível[/]"
-            console.print(Panel.fit(
-                f"[bold {self.config.theme_color}]Reprodutor de Música[/]\n" +
-                f"[bold {self.config.theme_color}]Player MPV: {mpv_status} | Pasta: {self.config.audio_path}[/]",
-                border_style=self.config.theme_color
-            ))
-            choice = questionary.select(
-                "Escolha uma opção:",
-                choices=[
-                    {"name": "Reproduzir Música Online", "value": "online"},
-                    {"name": "Reproduzir Todas as Músicas Baixadas", "value": "play_all_local"},
-                    {"name": "Reproduzir Música Baixada", "value": "local"},
-                    {"name": "Voltar", "value": "back"}
-                ],
-                style=custom_style
-            ).ask()
+    def _evict(self, conn):
+        max_bytes = float(self.config.metadata_cache_max_mb) * 1024 * 1024
+        if self._total_size <= max_bytes:
+            return
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM metadata ORDER BY accessed_at"):
+            if self._total_size <= max_bytes:
+                break
+            victims.append((key,))
+            self._total_size -= size
+        conn.executemany("DELETE FROM metadata WHERE key = ?", victims)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM metadata")
+            conn.commit()
+            self._total_size = 0
+
+class StreamCache:
+    """
+    Cache das URLs diretas de stream já resolvidas, indexado pela chave canônica do
+    vídeo e pelo formato escolhido. Cada entrada vale até o expire= embutido na URL
+    (ou STREAM_TTL, se não houver); acima de MAX_ENTRIES as menos usadas são removidas.
+    Fica no mesmo banco do cache de metadados, em uma tabela própria.
+    """
+    MAX_ENTRIES = 500
+    MARGIN = 300.0  # folga para a faixa terminar antes de a URL expirar
+    STREAM_TTL = 1800.0
+
+    def __init__(self, config: "DownloaderConfig"):
+        self.config = config
+        self.logger = config.logger
+        self.db_path = f"{config.base_dir}/metadata_cache.db"
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS streams ("
+                "key TEXT NOT NULL, format TEXT NOT NULL, url TEXT NOT NULL, title TEXT, "
+                "user_agent TEXT, expires_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+                "PRIMARY KEY (key, format))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_streams_accessed ON streams(accessed_at)")
+            conn.execute("DELETE FROM streams WHERE expires_at < ?", (time.time() + self.MARGIN,))
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _key(page_url: str) -> str:
+        return url_cache_key(page_url) or page_url.strip()
+
+    def get(self, page_url: str, fmt: str) -> Optional[dict]:
+        """
+        Retorna {"url", "title", "page_url", "user_agent"} se houver uma URL ainda válida.
+        """
+        key = self._key(page_url)
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT url, title, user_agent, expires_at FROM streams WHERE key = ? AND format = ?",
+                    (key, fmt)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[3] - self.MARGIN <= time.time():
+                    conn.execute("DELETE FROM streams WHERE key = ? AND format = ?", (key, fmt))
+                    conn.commit()
+                    return None
+                conn.execute(
+                    "UPDATE streams SET accessed_at = ? WHERE key = ? AND format = ?",
+                    (time.time(), key, fmt)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            self.logger.log(f"Falha ao ler cache de streams: {e}", "WARNING", context="StreamCache")
+            return None
+        return {"url": row[0], "title": row[1] or page_url, "page_url": page_url, "user_agent": row[2]}
+
+    def put(self, page_url: str, fmt: str, stream: dict):
+        now = time.time()
+        expires_at = url_expiry(stream["url"]) or now + self.STREAM_TTL
+        if expires_at - self.MARGIN <= now:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO streams (key, format, url, title, user_agent, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self._key(page_url), fmt, stream["url"], stream.get("title"),
+                     stream.get("user_agent"), expires_at, now)
+                )
+                conn.execute(
+                    "DELETE FROM streams WHERE rowid IN ("
+                    "SELECT rowid FROM streams ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.MAX_ENTRIES,)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            self.logger.log(f"Falha ao gravar cache de streams: {e}", "WARNING", context="StreamCache")
+
+AUDIO_MIME_EXTENSIONS = {
+    "audio/webm": "webm", "audio/mp4": "m4a", "audio/mpeg": "mp3", "audio/ogg": "ogg",
+    "audio/opus": "opus", "audio/aac": "aac", "audio/flac": "flac",
+    "video/webm": "webm", "video/mp4": "mp4",
+}
+
+def _stream_extension(url: str, content_type: Optional[str]) -> str:
+    """
+    Extensão do arquivo de um stream: pelo Content-Type, pelo mime= da URL
+    (googlevideo) ou pela extensão do caminho.
+    """
+    mime = (content_type or "").split(";")[0].strip().lower()
+    if mime not in AUDIO_MIME_EXTENSIONS:
+        mime = (parse_qs(urlparse(url).query).get('mime') or [""])[0].lower()
+    if mime in AUDIO_MIME_EXTENSIONS:
+        return AUDIO_MIME_EXTENSIONS[mime]
+    ext = os.path.splitext(urlparse(url).path)[1].lstrip('.').lower()
+    return ext if ext and len(ext) <= 4 else "mka"
+
+class AudioCache:
+    """
+    Cópias do áudio das músicas tocadas online, em {base_dir}/stream_cache, indexadas
+    pela chave canônica do vídeo. O áudio é baixado da URL direta já resolvida (sem nova
+    extração) e o mpv toca o próprio arquivo enquanto ele cresce, então o áudio vem da
+    rede uma só vez; as próximas reproduções usam o arquivo.
+    O total fica limitado a stream_cache_max_mb, removendo as menos tocadas recentemente.
+    promote() move um item para a pasta de músicas, com tags, sem baixar de novo.
+    """
+    CHUNK_SIZE = 10 * 1024 * 1024  # o googlevideo limita a velocidade sem Range
+
+    def __init__(self, config: "DownloaderConfig"):
+        self.config = config
+        self.logger = config.logger
+        self.dir = os.path.abspath(f"{config.base_dir}/stream_cache")
+        self.db_path = f"{config.base_dir}/metadata_cache.db"
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def enabled(self) -> bool:
+        return float(self.config.stream_cache_max_mb) > 0
+
+    def _max_bytes(self) -> float:
+        return float(self.config.stream_cache_max_mb) * 1024 * 1024
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio_cache ("
+                "key TEXT PRIMARY KEY, path TEXT NOT NULL, title TEXT, page_url TEXT, "
+                "size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.commit()
+            # Downloads interrompidos em uma execução anterior: arquivos fora do índice
+            indexed = {row[0] for row in conn.execute("SELECT path FROM audio_cache")}
+            for leftover in glob.glob(os.path.join(self.dir, "*")):
+                if leftover not in indexed:
+                    try:
+                        os.remove(leftover)
+                    except OSError:
+                        pass
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, page_url: str) -> Optional[dict]:
+        """
+        Retorna {"key", "path", "title", "page_url"} se o áudio da URL estiver no cache.
+        """
+        key = url_cache_key(page_url)
+        if not key:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT path, title FROM audio_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[0]):
+                conn.execute("DELETE FROM audio_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE audio_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        return {"key": key, "path": row[0], "title": row[1] or page_url, "page_url": page_url}
+
+    def fetch(self, page_url: str, stream: dict, abort: Optional[threading.Event] = None,
+              started: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Baixa o áudio da URL direta `stream["url"]` para o cache, em blocos com Range, já
+        no arquivo final; ele só entra no índice quando completo. started(caminho) é
+        chamado assim que os primeiros 64 KB estão no disco, para o mpv tocar o arquivo
+        enquanto ele cresce.
+        `abort` interrompe o download no próximo bloco de 64 KB.
+        Retorna o caminho do arquivo ou None (cache desativado, arquivo grande demais,
+        download interrompido ou erro).
+        """
+        key = url_cache_key(page_url)
+        if not key or not self.enabled():
+            return None
+        cached = self.lookup(page_url)
+        if cached:
+            return cached["path"]
+        os.makedirs(self.dir, exist_ok=True)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        headers = {"User-Agent": stream["user_agent"]} if stream.get("user_agent") else {}
+        proxies = {"http": self.config.proxy_url, "https": self.config.proxy_url} if self.config.proxy_url else None
+        path = None
+        f = None
+        size = 0
+        try:
+            while True:
+                headers["Range"] = f"bytes={size}-{size + self.CHUNK_SIZE - 1}"
+                with requests.get(stream["url"], headers=headers, proxies=proxies, stream=True, timeout=30) as resp:
+                    resp.raise_for_status()
+                    content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                    if not content_type.startswith(("audio/", "video/")):
+                        # Ex: página HTML no lugar do stream
+                        raise ValueError(f"Content-Type inesperado: {content_type or 'ausente'}")
+                    total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+                    if total.isdigit() and int(total) > self._max_bytes():
+                        raise ValueError("arquivo maior que o limite do cache")
+                    if f is None:
+                        path = os.path.join(self.dir, f"{name}.{_stream_extension(stream['url'], content_type)}")
+                        f = open(path, 'wb')
+                    for chunk in resp.iter_content(64 * 1024):
+                        if abort is not None and abort.is_set():
+                            raise InterruptedError("download interrompido")
+                        f.write(chunk)
+                        size += len(chunk)
+                        if size > self._max_bytes():
+                            raise ValueError("arquivo maior que o limite do cache")
+                        if started is not None:
+                            f.flush()
+                            started(path)
+                            started = None
+                f.flush()
+                if resp.status_code != 206 or not total.isdigit() or size >= int(total):
+                    break
+            f.close()
+        except Exception as e:
+            level = "DEBUG" if isinstance(e, InterruptedError) else "WARNING"
+            self.logger.log(f"Falha ao guardar o áudio de {page_url} no cache: {e}", level, context="AudioCache")
+            if f is not None:
+                f.close()
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return None
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO audio_cache (key, path, title, page_url, size, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, path, stream.get("title"), page_url, size, time.time())
+            )
+            self._evict(conn)
+            conn.commit()
+        self.logger.log(f"Áudio de {page_url} guardado no cache ({size} bytes)", "DEBUG", context="AudioCache")
+        return path
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio_cache").fetchone()[0]
+        max_bytes = self._max_bytes()
+        victims = []
+        for key, path, size in conn.execute("SELECT key, path, size FROM audio_cache ORDER BY accessed_at"):
+            if total <= max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        conn.executemany("DELETE FROM audio_cache WHERE key = ?", victims)
+
+    def promote(self, page_url: str, dest_dir: str, tags: Dict[str, str]) -> Optional[str]:
+        """
+        Move o áudio em cache para dest_dir, nomeado pelo título e com as tags
+        (title, artist, album) gravadas. Áudio WebM é remuxado para .opus (sem
+        recodificar) quando o ffmpeg existe, para aceitar tags. Retorna o novo caminho.
+        """
+        cached = self.lookup(page_url)
+        if not cached:
+            return None
+        src = cached["path"]
+        ext = os.path.splitext(src)[1].lstrip('.')
+        remux = ext == "webm" and shutil.which("ffmpeg")
+        if remux:
+            ext = "opus"
+        os.makedirs(dest_dir, exist_ok=True)
+        base = yt_dlp.utils.sanitize_filename(tags.get("title") or cached["title"]) or cached["key"]
+        dest = os.path.join(dest_dir, f"{base}.{ext}")
+        counter = 1
+        while os.path.exists(dest):
+            dest = os.path.join(dest_dir, f"{base} ({counter}).{ext}")
+            counter += 1
+        try:
+            if remux:
+                subprocess.run(
+                    ["ffmpeg", "-y", "-loglevel", "error", "-i", src, "-vn", "-c:a", "copy", dest],
+                    check=True, capture_output=True
+                )
+                os.remove(src)
+            else:
+                shutil.move(src, dest)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.logger.log(f"Falha ao mover {src} para a biblioteca: {e}", "ERROR", context="AudioCache", exc=e)
+            return None
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM audio_cache WHERE key = ?", (cached["key"],))
+            conn.commit()
+        try:
+            audio = mutagen.File(dest, easy=True)
+            if audio is not None:
+                if audio.tags is None:
+                    audio.add_tags()
+                for field, value in tags.items():
+                    if value:
+                        audio[field] = str(value)
+                audio.save()
+        except Exception as e:
+            self.logger.log(f"Falha ao gravar tags em {dest}: {e}", "WARNING", context="AudioCache")
+        return dest
+
+class DownloadArchive:
+    """
+    Arquivo indexado (SQLite) de downloads concluídos, por tipo (áudio ou vídeo),
+    indexado por "<extrator> <id>" com caminho, formato, tamanho e hash do arquivo final.
+    Também é passado ao yt-dlp como download_archive (implementa "in" e add()).
+    """
+    def __init__(self, config: "DownloaderConfig", kind: str, db_path: Optional[str] = None):
+        self.config = config
+        self.logger = config.logger
+        self.kind = kind
+        self.db_path = db_path or f"{config.base_dir}/archive.db"
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS downloads ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, path TEXT, format TEXT, size INTEGER, "
+                "sha256 TEXT, downloaded_at REAL NOT NULL, PRIMARY KEY (kind, key))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _present(self, key: Optional[str]) -> (bool, Optional[str]):
+        """
+        (registrado, caminho). Entradas cujo arquivo foi apagado do disco são descartadas;
+        entradas sem caminho (gravadas pelo yt-dlp via add()) continuam valendo.
+        """
+        if not key:
+            return False, None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT path FROM downloads WHERE kind = ? AND key = ?", (self.kind, key)
+            ).fetchone()
+            if row is None:
+                return False, None
+            if not row[0]:
+                return True, None
+            if os.path.exists(row[0]):
+                return True, row[0]
+            conn.execute("DELETE FROM downloads WHERE kind = ? AND key = ?", (self.kind, key))
+            conn.commit()
+            return False, None
+
+    def lookup(self, key: Optional[str]) -> Optional[str]:
+        """
+        Retorna o caminho do arquivo já baixado para a chave, ou None
+        (também para entradas sem caminho registrado).
+        """
+        return self._present(key)[1]
+
+    def get(self, key: Optional[str]) -> Optional[dict]:
+        """
+        Retorna todos os dados registrados para a chave, ou None.
+        """
+        if not key or self.lookup(key) is None:
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT path, format, size, sha256, downloaded_at FROM downloads WHERE kind = ? AND key = ?",
+                (self.kind, key)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("path", "format", "size", "sha256", "downloaded_at"), row))
+
+    def record(self, key: str, path: str, media_format: Optional[str] = None):
+        """
+        Registra um download concluído, calculando tamanho e SHA-256 do arquivo final.
+        """
+        try:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            size = os.path.getsize(path)
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO downloads (kind, key, path, format, size, sha256, downloaded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.kind, key, os.path.abspath(path), media_format, size, digest.hexdigest(), time.time())
+                )
+                conn.commit()
+        except Exception as e:
+            self.logger.log(f"Falha ao registrar download no arquivo: {e}", "WARNING", context="DownloadArchive")
+
+    def remove(self, key: Optional[str]):
+        if not key:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM downloads WHERE kind = ? AND key = ?", (self.kind, key))
+            conn.commit()
+
+    # Interface usada pelo yt-dlp (YoutubeDL.archive)
+    def __contains__(self, key) -> bool:
+        return self._present(key)[0]
+
+    def add(self, key: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR IGNORE INTO downloads (kind, key, downloaded_at) VALUES (?, ?, ?)",
+                (self.kind, key, time.time())
+            )
+            conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM downloads WHERE kind = ?", (self.kind,)
+            ).fetchone()[0]
+
+def _normalize_text(text: str) -> str:
+    """
+    Minúsculas e sem acentos, para comparar títulos.
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class OnlineHistory:
+    """
+    Histórico de músicas reproduzidas online em JSON-lines (uma entrada por linha).
+    Registrar uma reprodução é um único append; entradas repetidas (mesmo título e URL)
+    são unificadas na leitura e o arquivo é compactado periodicamente, mantendo as
+    últimas `retention` entradas (0 = sem limite). A leitura fica em cache pelo mtime.
+    Um índice de trigramas dos títulos e de URL/ID é mantido junto, para a busca.
+    """
+    def __init__(self, path: str, logger: Logger, retention: int = 50, legacy_path: Optional[str] = None):
+        self.path = path
+        self.logger = logger
+        self.retention = retention
+        self.legacy_path = legacy_path
+        self._lock = threading.RLock()
+        self._entries = None  # {(título, url): entrada}, da mais antiga para a mais recente
+        self._stamp = None
+        self._lines = 0
+        self._reset_index()
+
+    @staticmethod
+    def entry_key(entry: dict):
+        return (entry.get("title"), entry.get("url"))
+
+    @staticmethod
+    def _url_id(url: str) -> str:
+        match = _YOUTUBE_ID_RE.search(url or "")
+        return match.group(1) if match else (url or "").strip()
+
+    def _reset_index(self):
+        self._grams = {}     # trigrama -> {chave}
+        self._titles = {}    # chave -> (título normalizado, trigramas)
+        self._ids = {}       # ID do vídeo ou URL -> {chave}
+        self._seq = {}       # chave -> ordem de inserção (maior = mais recente)
+        self._counter = 0
+        self._indexed = False  # o índice é construído na primeira busca
+
+    def _build_index(self):
+        for key, entry in self._entries.items():
+            self._index(key, entry)
+        self._indexed = True
+
+    def _index(self, key, entry: dict):
+        title = _normalize_text(entry.get("title") or "")
+        grams = _trigrams(title) if title else set()
+        self._titles[key] = (title, grams)
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(key)
+        self._ids.setdefault(self._url_id(entry.get("url")), set()).add(key)
+
+    def _unindex(self, key, entry: dict):
+        self._seq.pop(key, None)
+        if not self._indexed:
+            return
+        _, grams = self._titles.pop(key, ("", ()))
+        for gram in grams:
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+        keys = self._ids.get(self._url_id(entry.get("url")))
+        if keys is not None:
+            keys.discard(key)
+
+    def _add(self, entry: dict):
+        key = self.entry_key(entry)
+        old = self._entries.pop(key, None)
+        self._entries[key] = entry
+        self._counter += 1
+        self._seq[key] = self._counter
+        if old is None and self._indexed:
+            self._index(key, entry)
+        # Descarta a entrada mais antiga quando passa do limite
+        while self.retention and len(self._entries) > self.retention:
+            oldest = next(iter(self._entries))
+            self._unindex(oldest, self._entries.pop(oldest))
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _migrate_legacy(self):
+        """
+        Converte o antigo history_online.json (lista JSON) para JSON-lines.
+        """
+        if not self.legacy_path or os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            self._rewrite([e for e in entries if isinstance(e, dict)])
+            os.remove(self.legacy_path)
+            self.logger.log("Histórico online convertido para JSON-lines", context="OnlineHistory")
+        except Exception as e:
+            self.logger.log(f"Erro ao converter histórico antigo: {e}", "ERROR", context="OnlineHistory")
+
+    def _load(self):
+        """
+        Lê o arquivo apenas se ele mudou desde a última leitura.
+        """
+        self._migrate_legacy()
+        stamp = self._file_stamp()
+        if self._entries is not None and stamp == self._stamp:
+            return
+        self._entries = {}
+        self._reset_index()
+        lines = 0
+        if stamp is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    lines += 1
+                    self._add(entry)
+        self._stamp = stamp
+        self._lines = lines
+        if self._needs_compaction():
+            self.compact()
+
+    def _needs_compaction(self) -> bool:
+        return self._lines > 2 * len(self._entries) + 100
+
+    def _rewrite(self, entries: List[dict]):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+
+    def compact(self, exclude=None):
+        """
+        Reescreve o arquivo sem duplicatas, respeitando o limite de retenção.
+        `exclude` é um conjunto de chaves (título, url) a remover.
+        """
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            for key in exclude or ():
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._unindex(key, entry)
+            while self.retention and len(self._entries) > self.retention:
+                oldest = next(iter(self._entries))
+                self._unindex(oldest, self._entries.pop(oldest))
+            try:
+                self._rewrite(list(self._entries.values()))
+            except Exception as e:
+                self.logger.log(f"Erro ao compactar histórico online: {e}", "ERROR", context="OnlineHistory")
+                self._entries = None
+                return
+            self._stamp = self._file_stamp()
+            self._lines = len(self._entries)
+
+    def add(self, title: str, url: str):
+        entry = {
+            "title": title,
+            "url": url,
+            "timestamp": datetime.now().isoformat()
+        }
+        with self._lock:
+            self._migrate_legacy()
+            cached = self._entries is not None and self._file_stamp() == self._stamp
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            if cached:
+                # Mantém o cache e o índice em dia sem reler o arquivo
+                self._add(entry)
+                self._stamp = self._file_stamp()
+                self._lines += 1
+                if self._needs_compaction():
+                    self.compact()
+        return entry
+
+    def entries(self) -> List[dict]:
+        """
+        Entradas sem duplicatas, da mais antiga para a mais recente.
+        """
+        with self._lock:
+            self._load()
+            return list(self._entries.values())
+
+    def remove(self, keys):
+        self.compact(exclude=set(keys))
+
+    def search(self, query: str = "", limit: Optional[int] = None) -> List[dict]:
+        """
+        Busca no histórico por título (trigramas, tolerante a erros de digitação),
+        URL ou ID do vídeo. Retorna as entradas da mais relevante para a menos
+        relevante; empates e busca vazia ficam em ordem da mais recente.
+        """
+        with self._lock:
+            self._load()
+            if not self._indexed:
+                self._build_index()
+            query = (query or "").strip()
+            if not query:
+                keys = sorted(self._entries, key=self._seq.get, reverse=True)
+            else:
+                keys = self._rank(query)
+            results = [self._entries[key] for key in keys if key in self._entries]
+        return results[:limit] if limit else results
+
+    ID_SCORE = 3.0  # acima de qualquer pontuação de título (no máximo 2.0)
+
+    def _rank(self, query: str) -> list:
+        """
+        Chaves por pontuação e, nos empates, da mais recente para a mais antiga.
+        Entradas com o ID (ou a URL) buscado vêm antes das que só batem pelo título.
+        """
+        scores = self._score_titles(_normalize_text(query))
+        for key in self._ids.get(self._url_id(query), ()):
+            scores[key] = self.ID_SCORE
+        return sorted(scores, key=lambda key: (scores[key], self._seq.get(key, 0)), reverse=True)
+
+    def _score_titles(self, text: str) -> dict:
+        if len(text) < 3:
+            # Trigramas não ajudam em buscas muito curtas
+            return {key: 1.0 for key, (title, _) in self._titles.items() if text in title}
+        query_grams = _trigrams(text)
+        counts = {}
+        for gram in query_grams:
+            for key in self._grams.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+        scores = {}
+        for key, shared in counts.items():
+            score = shared / len(query_grams)
+            if text in self._titles[key][0]:
+                score += 1.0
+            if score >= 0.4:
+                scores[key] = score
+        return scores
+
+HISTORY_PAGE_SIZE = 20
+
+def _search_filter_options() -> dict:
+    """
+    Filtro por digitação nas listas do questionary (2.0+); versões antigas não o aceitam.
+    """
+    if "use_search_filter" in inspect.signature(questionary.select).parameters:
+        return {"use_search_filter": True, "use_jk_keys": False}
+    return {}
+
+def pick_from_history(history: OnlineHistory, message: str, multiple: bool = False) -> List[dict]:
+    """
+    Busca com filtro digitado e resultados paginados, dos mais relevantes para os menos
+    relevantes; na página, digitar filtra os itens exibidos. Retorna as entradas
+    escolhidas (uma só, se multiple=False) ou lista vazia se o usuário voltar.
+    """
+    filter_options = _search_filter_options()
+    query = ""
+    page = 0
+    while True:
+        results = history.search(query)
+        if not results:
+            if not query:
+                return []
+            console.print(f"[yellow]Nada encontrado para \"{query}\".[/]")
+            query = questionary.text("Buscar no histórico (vazio = mais recentes):", style=custom_style()).ask()
+            if query is None:
+                return []
+            page = 0
+            continue
+        pages = (len(results) + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        page = min(page, pages - 1)
+        shown = results[page * HISTORY_PAGE_SIZE:(page + 1) * HISTORY_PAGE_SIZE]
+        choices = [{"name": item.get("title") or item.get("url"), "value": index} for index, item in enumerate(shown)]
+        navigation = [{"name": "🔎 Buscar", "value": "search"}]
+        if page + 1 < pages:
+            navigation.append({"name": "Próxima página", "value": "next"})
+        if page > 0:
+            navigation.append({"name": "Página anterior", "value": "prev"})
+        navigation.append({"name": "Voltar", "value": "back"})
+        title = f"{message} ({len(results)} itens, página {page + 1}/{pages}" + (f", busca: \"{query}\")" if query else ")")
+        if multiple:
+            action = questionary.select(
+                title,
+                choices=[{"name": "Selecionar itens desta página", "value": "pick"}] + navigation,
+                style=custom_style()
+            ).ask()
+            if action == "pick":
+                picked = questionary.checkbox(
+                    "Use espaço para selecionar, Enter para confirmar (digite para filtrar):",
+                    choices=choices,
+                    style=custom_style(),
+                    **filter_options
+                ).ask()
+                return [shown[index] for index in picked or []]
+        else:
+            action = questionary.select(title, choices=choices + navigation, style=custom_style(), **filter_options).ask()
+            if isinstance(action, int):
+                return [shown[action]]
+        if action == "search":
+            query = questionary.text(
+                "Buscar no histórico (título, URL ou ID; vazio = mais recentes):",
+                default=query,
+                style=custom_style()
+            ).ask()
+            if query is None:
+                return []
+            page = 0
+        elif action == "next":
+            page += 1
+        elif action == "prev":
+            page -= 1
+        else:
+            return []
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.aac', '.opus', '.ogg', '.wav', '.flac')
+
+def format_duration(seconds: Optional[float]) -> str:
+    if not seconds:
+        return "--:--"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+def format_size(num_bytes: Optional[float]) -> str:
+    if num_bytes is None:
+        return "?"
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.2f} GB"
+
+class MusicLibrary:
+    """
+    Índice persistente (SQLite) das músicas da pasta de áudio: caminho, tamanho, mtime,
+    duração e tags (título, artista, álbum) lidas com mutagen. A atualização percorre a
+    árvore com os.scandir e só relista pastas cujo mtime mudou; as demais são puladas,
+    usando as subpastas já conhecidas.
+    """
+    SORTS = {
+        'path': "path",
+        'artist': "artist IS NULL, artist COLLATE NOCASE, album COLLATE NOCASE, path",
+        'album': "album IS NULL, album COLLATE NOCASE, path",
+        'duration': "duration IS NULL, duration, path",
+        'recent': "mtime_ns DESC",
+    }
+
+    TAG_WORKERS = 8      # leituras de tags simultâneas (limitadas pela latência de I/O)
+    TAG_BATCH = 50       # tags gravadas no banco a cada N arquivos
+
+    def __init__(self, config: "DownloaderConfig", db_path: Optional[str] = None):
+        self.config = config
+        self.logger = config.logger
+        self.db_path = db_path or f"{config.base_dir}/library.db"
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "path TEXT PRIMARY KEY, dir TEXT NOT NULL, size INTEGER, mtime_ns INTEGER, "
+                "duration REAL, title TEXT, artist TEXT, album TEXT, tagged INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs(parent)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_dir ON tracks(dir)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_artist ON tracks(artist)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_album ON tracks(album)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _root(root: str) -> str:
+        return os.path.normpath(root)
+
+    def _in_root(self, root: str):
+        """
+        Condição SQL (e parâmetros) para caminhos dentro de `root`.
+        """
+        prefix = self._root(root).rstrip(os.sep) + os.sep
+        return "substr(path, 1, ?) = ?", (len(prefix), prefix)
+
+    def _drop_dir(self, conn, path: str):
+        """
+        Remove do índice uma pasta que deixou de existir, com tudo o que havia dentro.
+        """
+        prefix = path.rstrip(os.sep) + os.sep
+        conn.execute("DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+        return conn.execute(
+            "DELETE FROM tracks WHERE dir = ? OR substr(dir, 1, ?) = ?", (path, len(prefix), prefix)
+        ).rowcount
+
+    def refresh(self, root: Optional[str] = None, read_tags: bool = True) -> dict:
+        """
+        Atualiza o índice da pasta `root` (padrão: pasta de áudio). Retorna contadores
+        de pastas listadas/puladas e músicas adicionadas/removidas. Com read_tags=False,
+        as tags ficam pendentes para read_pending_tags().
+        """
+        root = self._root(root or self.config.audio_path)
+        stats = {"scanned": 0, "skipped": 0, "added": 0, "removed": 0}
+        with self._lock:
+            conn = self._connect()
+            known = dict(conn.execute("SELECT path, mtime_ns FROM dirs").fetchall())
+            stack = [root]
+            while stack:
+                directory = stack.pop()
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    stats["removed"] += self._drop_dir(conn, directory)
+                    continue
+                if known.get(directory) == mtime_ns:
+                    # Nada foi criado, renomeado ou apagado nesta pasta
+                    stats["skipped"] += 1
+                    stack.extend(row[0] for row in conn.execute("SELECT path FROM dirs WHERE parent = ?", (directory,)))
+                    continue
+                stats["scanned"] += 1
+                files = {}
+                subdirs = []
+                try:
+                    with os.scandir(directory) as it:
+                        for entry in it:
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    subdirs.append(entry.path)
+                                elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                                    st = entry.stat()
+                                    files[entry.path] = (st.st_size, st.st_mtime_ns)
+                            except OSError:
+                                continue
+                except OSError as e:
+                    self.logger.log(f"Não foi possível listar {directory}: {e}", "WARNING", context="MusicLibrary")
+                    continue
+                existing = {
+                    path: (size, mtime)
+                    for path, size, mtime in conn.execute(
+                        "SELECT path, size, mtime_ns FROM tracks WHERE dir = ?", (directory,)
+                    )
+                }
+                removed = [path for path in existing if path not in files]
+                conn.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in removed])
+                changed = [(path, directory, size, mtime) for path, (size, mtime) in files.items() if existing.get(path) != (size, mtime)]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tracks (path, dir, size, mtime_ns, tagged) VALUES (?, ?, ?, ?, 0)", changed
+                )
+                stats["removed"] += len(removed)
+                stats["added"] += len(changed)
+                old_subdirs = {row[0] for row in conn.execute("SELECT path FROM dirs WHERE parent = ?", (directory,))}
+                for gone in old_subdirs.difference(subdirs):
+                    stats["removed"] += self._drop_dir(conn, gone)
+                conn.execute(
+                    "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+                    (directory, None if directory == root else os.path.dirname(directory), mtime_ns)
+                )
+                stack.extend(subdirs)
+            conn.commit()
+        if read_tags:
+            self.read_pending_tags(root)
+        return stats
+
+    def _read_tags(self, path: str) -> tuple:
+        """
+        (duração, título, artista, álbum) de um arquivo; campos ausentes ficam None.
+        """
+        try:
+            audio = mutagen.File(path, easy=True)
+        except Exception as e:
+            self.logger.log(f"Falha ao ler tags de {path}: {e}", "DEBUG", context="MusicLibrary")
+            return (None, None, None, None)
+        if audio is None:
+            return (None, None, None, None)
+        duration = getattr(getattr(audio, "info", None), "length", None)
+        tags = audio.tags or {}
+        def first(name):
+            try:
+                values = tags.get(name)
+            except Exception:
+                return None
+            if not values:
+                return None
+            return str(values[0]).strip() or None
+        return (duration, first("title"), first("artist"), first("album"))
+
+    def pending_count(self, root: Optional[str] = None) -> int:
+        condition, params = self._in_root(root or self.config.audio_path)
+        with self._lock:
+            return self._connect().execute(
+                f"SELECT COUNT(*) FROM tracks WHERE tagged = 0 AND {condition}", params
+            ).fetchone()[0]
+
+    def read_pending_tags(self, root: Optional[str] = None, workers: Optional[int] = None, progress=None) -> int:
+        """
+        Lê duração e tags dos arquivos novos ou alterados em um pool de threads limitado.
+        Os resultados são gravados em lotes: se a leitura for interrompida, o que já foi
+        lido fica salvo e o restante continua pendente para a próxima vez.
+        `progress(lidos, total)` é chamado a cada arquivo. Retorna quantos foram lidos.
+        """
+        condition, params = self._in_root(root or self.config.audio_path)
+        with self._lock:
+            pending = [row[0] for row in self._connect().execute(
+                f"SELECT path FROM tracks WHERE tagged = 0 AND {condition}", params
+            )]
+        if not pending:
+            return 0
+        workers = max(1, min(workers or self.TAG_WORKERS, len(pending)))
+        done = 0
+        batch = []
+        futures = {}
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tags")
+        try:
+            # Submete aos poucos para não enfileirar milhares de tarefas de uma vez
+            paths = iter(pending)
+            for path in paths:
+                futures[pool.submit(self._read_tags, path)] = path
+                if len(futures) >= workers * 4:
+                    break
+            while futures:
+                finished = next(as_completed(futures))
+                path = futures.pop(finished)
+                batch.append((*finished.result(), path))
+                done += 1
+                if len(batch) >= self.TAG_BATCH:
+                    self._store_tags(batch)
+                    batch = []
+                if progress:
+                    progress(done, len(pending))
+                next_path = next(paths, None)
+                if next_path is not None:
+                    futures[pool.submit(self._read_tags, next_path)] = next_path
+        finally:
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+            if batch:
+                self._store_tags(batch)
+        return done
+
+    def _store_tags(self, rows: List[tuple]):
+        """
+        rows: [(duração, título, artista, álbum, caminho)]
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "UPDATE tracks SET duration = ?, title = ?, artist = ?, album = ?, tagged = 1 WHERE path = ?",
+                rows
+            )
+            conn.commit()
+
+    def tracks(self, sort: str = "path", artist: Optional[str] = None, album: Optional[str] = None,
+               root: Optional[str] = None) -> List[dict]:
+        condition, params = self._in_root(root or self.config.audio_path)
+        if artist is not None:
+            condition += " AND artist IS ?"
+            params += (artist,)
+        if album is not None:
+            condition += " AND album IS ?"
+            params += (album,)
+        order = self.SORTS.get(sort, self.SORTS['path'])
+        with self._lock:
+            cursor = self._connect().execute(
+                f"SELECT path, size, mtime_ns, duration, title, artist, album FROM tracks "
+                f"WHERE {condition} ORDER BY {order}", params
+            )
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def groups(self, field: str, root: Optional[str] = None) -> List[tuple]:
+        """
+        Valores distintos de "artist" ou "album" com a contagem de músicas.
+        """
+        if field not in ("artist", "album"):
+            raise ValueError(field)
+        condition, params = self._in_root(root or self.config.audio_path)
+        with self._lock:
+            return self._connect().execute(
+                f"SELECT {field}, COUNT(*) FROM tracks WHERE {condition} "
+                f"GROUP BY {field} ORDER BY {field} IS NULL, {field} COLLATE NOCASE", params
+            ).fetchall()
+
+class MpvPlayer:
+    """
+    Mantém uma única instância do mpv aberta (--idle) e a controla por JSON IPC
+    (--input-ipc-server). As músicas entram na playlist do mpv com "loadfile ... append",
+    então a troca de faixa é contínua (gapless) e sem reiniciar o processo.
+    O estado (faixa atual, posição na playlist, pausa) chega por eventos do mpv.
+    """
+    OBSERVED = ("media-title", "path", "playlist-pos", "playlist-count", "duration", "pause", "idle-active")
+
+    def __init__(self, logger: Logger, extra_args: Optional[List[str]] = None):
+        self.logger = logger
+        self.extra_args = list(extra_args or [])
+        self.socket_path = os.path.join(tempfile.gettempdir(), f"ytd-mpv-{os.getpid()}.sock")
+        self.state = {}
+        self.titles = {}      # caminho/URL -> título exibido
+        self.listeners = []   # chamados a cada mudança de estado
+        self._process = None
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._pending = {}    # request_id -> [Event, resposta]
+        self._request_id = 0
+        self._atexit = False
+
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None and self._sock is not None
+
+    def start(self) -> bool:
+        if self.running():
+            return True
+        self.quit()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+        cmd = [
+            "mpv", "--idle=yes", "--no-terminal", "--no-video",
+            "--gapless-audio=yes", "--prefetch-playlist=yes",
+            f"--input-ipc-server={self.socket_path}", *self.extra_args
+        ]
+        try:
+            self._process = subprocess.Popen(
+                cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            self.logger.log(f"Falha ao iniciar o mpv: {e}", "ERROR", context="MpvPlayer")
+            return False
+        sock = None
+        deadline = time.time() + 5
+        while time.time() < deadline and self._process.poll() is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                break
+            except OSError:
+                sock.close()
+                sock = None
+                time.sleep(0.05)
+        if sock is None:
+            self.logger.log("O mpv não abriu o socket de IPC", "ERROR", context="MpvPlayer")
+            self.quit()
+            return False
+        self._sock = sock
+        self.state = {}
+        threading.Thread(target=self._read_loop, args=(sock,), name="mpv-ipc", daemon=True).start()
+        for index, name in enumerate(self.OBSERVED, 1):
+            self.command("observe_property", index, name)
+        if not self._atexit:
+            atexit.register(self.quit)
+            self._atexit = True
+        return True
+
+    def _read_loop(self, sock):
+        try:
+            with sock.makefile("r", encoding="utf-8", errors="replace") as stream:
+                for line in stream:
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        continue
+                    request_id = message.get("request_id")
+                    if request_id in self._pending:
+                        waiter = self._pending[request_id]
+                        waiter[1] = message
+                        waiter[0].set()
+                    elif message.get("event") == "property-change":
+                        self.state[message.get("name")] = message.get("data")
+                        self._notify()
+        except (OSError, ValueError):
+            pass
+        # Conexão encerrada: libera quem estiver esperando resposta
+        if self._sock is sock:
+            self._sock = None
+        for waiter in list(self._pending.values()):
+            waiter[0].set()
+        self._notify()
+
+    def _notify(self):
+        for listener in list(self.listeners):
+            try:
+                listener(self)
+            except Exception:
+                pass
+
+    def command(self, *args, timeout: float = 3.0):
+        """
+        Envia um comando ao mpv e retorna o campo "data" da resposta.
+        """
+        sock = self._sock
+        if sock is None:
+            raise RuntimeError("mpv não está em execução")
+        with self._send_lock:
+            self._request_id += 1
+            request_id = self._request_id
+            waiter = [threading.Event(), None]
+            self._pending[request_id] = waiter
+            payload = json.dumps({"command": list(args), "request_id": request_id}) + "\n"
+            try:
+                sock.sendall(payload.encode("utf-8"))
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                raise RuntimeError(f"falha ao falar com o mpv: {e}")
+        try:
+            if not waiter[0].wait(timeout) or waiter[1] is None:
+                raise RuntimeError(f"sem resposta do mpv para {args[0]}")
+        finally:
+            self._pending.pop(request_id, None)
+        response = waiter[1]
+        if response.get("error") != "success":
+            raise RuntimeError(f"mpv: {args[0]}: {response.get('error')}")
+        return response.get("data")
+
+    def load(self, items: List[str], append: bool = False, start: int = 0, titles: Optional[Dict[str, str]] = None):
+        """
+        Substitui a playlist por `items` começando em `start`, ou (append=True) os coloca
+        no fim da fila, começando a tocar se o player estiver parado.
+        """
+        if titles:
+            self.titles.update(titles)
+        if not append and start:
+            # A faixa `start` entra primeiro e já começa a tocar; as anteriores são movidas
+            # para antes dela sem interromper a reprodução (trocar o playlist-pos depois
+            # do load tocaria um trecho do item 0)
+            items = items[start:] + items[:start]
+        for index, item in enumerate(items):
+            if index == 0:
+                mode = "append-play" if append else "replace"
+            else:
+                mode = "append"
+            self.command("loadfile", item, mode)
+        if not append and start:
+            for index in range(start):
+                self.command("playlist-move", len(items) - start + index, index)
+
+    def next(self):
+        self.command("playlist-next")
+
+    def prev(self):
+        self.command("playlist-prev")
+
+    def seek(self, seconds: float):
+        self.command("seek", seconds, "relative")
+
+    def toggle_pause(self):
+        self.command("cycle", "pause")
+
+    def stop(self):
+        """
+        Para a reprodução e esvazia a playlist, mantendo o mpv aberto.
+        """
+        self.command("stop")
+
+    def quit(self):
+        if self._sock is not None:
+            try:
+                self.command("quit", timeout=1)
+            except RuntimeError:
+                pass
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self._process.terminate()
+            self._process = None
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+    def now_playing(self, query_position: bool = True) -> dict:
+        """
+        Estado atual para exibição: título, posição, duração, faixa/total, pausa, ocioso.
+        Em listeners (thread de leitura do IPC) use query_position=False: a posição exige
+        uma consulta ao mpv, cuja resposta chegaria pela própria thread que está esperando.
+        """
+        state = dict(self.state)
+        position = None
+        if query_position and self.running() and not state.get("idle-active", True):
+            try:
+                position = self.command("get_property", "time-pos", timeout=1)
+            except RuntimeError:
+                position = None
+        path = state.get("path")
+        playlist_pos = state.get("playlist-pos")
+        return {
+            "title": self.titles.get(path) or state.get("media-title") or path,
+            "position": position,
+            "duration": state.get("duration"),
+            "index": playlist_pos + 1 if isinstance(playlist_pos, int) and playlist_pos >= 0 else None,
+            "count": state.get("playlist-count") or 0,
+            "paused": bool(state.get("pause")),
+            "idle": not self.running() or state.get("idle-active", True),
+        }
+
+class DownloadJob:
+    """
+    Contexto de um único download: URL, opções, fase, contadores de bytes, velocidade,
+    tempos e resultado. Cada job recebe o próprio hook de progresso.
+    """
+    def __init__(self, url: str, options: dict, download_type: str, info: Optional[dict] = None):
+        self.url = url
+        self.options = options
+        self.download_type = download_type
+        self.info = info  # info dict já extraído (sem processar), reaproveitado no download
+        self.status = "queued"
+        self.title = info.get('title') if info else None
+        self.files: Dict[str, List[Optional[int]]] = {}  # arquivo -> [baixados, total]
+        self.speed = None
+        self.eta = None
+        self.spans: Dict[str, float] = {}  # fase -> segundos (extraction, transfer, merge, ...)
+        self._span_starts: Dict[str, float] = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.first_byte_at = None
+        self.download_finished_at = None
+        self.finished_at = None
+        self.success = None
+        self.result = None
+        self.filepath = None
+
+    def skip(self, reason: str, filepath: Optional[str] = None) -> "DownloadJob":
+        """
+        Marca o job como pulado (não será enviado ao pool).
+        """
+        self.status = "skipped"
+        self.success = True
+        self.result = reason
+        self.filepath = filepath
+        return self
+
+    def fail(self, reason: str) -> "DownloadJob":
+        """
+        Marca o job como falho sem enviá-lo ao pool (ex: URL inválida).
+        """
+        self.status = "failed"
+        self.success = False
+        self.result = reason
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "type": self.download_type,
+            "status": self.status,
+            "title": self.title,
+            "result": self.result,
+            "path": self.filepath,
+            "bytes": self.downloaded_bytes,
+            "elapsed": round(self.elapsed, 3),
+            "throughput": round(self.throughput, 1),
+            "spans": {phase: round(seconds, 3) for phase, seconds in self.spans.items()},
+        }
+
+    def begin(self, phase: str, at: Optional[float] = None):
+        self._span_starts.setdefault(phase, at or time.time())
+
+    def end(self, phase: str, at: Optional[float] = None):
+        """
+        Fecha a fase aberta por begin(); fases repetidas (ex: dois arquivos) se somam.
+        """
+        started = self._span_starts.pop(phase, None)
+        if started is not None:
+            self.spans[phase] = self.spans.get(phase, 0.0) + (at or time.time()) - started
+
+    def end_all(self):
+        for phase in list(self._span_starts):
+            self.end(phase)
+
+    @property
+    def downloaded_bytes(self) -> int:
+        return sum(done or 0 for done, _ in list(self.files.values()))
+
+    @property
+    def total_bytes(self) -> Optional[int]:
+        totals = [total for _, total in list(self.files.values())]
+        if not totals or None in totals:
+            return None
+        return sum(totals)
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """
+        Taxa média de transferência do job em bytes/s.
+        """
+        if self.first_byte_at is None:
+            return 0.0
+        end = self.download_finished_at or self.finished_at or time.time()
+        duration = end - self.first_byte_at
+        return self.downloaded_bytes / duration if duration > 0 else 0.0
+
+    def summary(self) -> str:
+        size_mb = self.downloaded_bytes / (1024 * 1024)
+        speed_mb = self.throughput / (1024 * 1024)
+        return f"{size_mb:.1f} MB em {self.elapsed:.1f}s, {speed_mb:.2f} MB/s"
+
+class DownloadMetrics:
+    """
+    Métricas dos downloads: uma linha JSON por job em {base_dir}/metrics.jsonl, com os
+    tempos de cada fase, e opcionalmente um arquivo no formato texto do Prometheus
+    (para o textfile collector do node_exporter) com os totais desde o início do programa.
+    """
+    MAX_BYTES = 5 * 1024 * 1024  # metrics.jsonl vira metrics.jsonl.1 ao passar disso
+
+    def __init__(self, config: "DownloaderConfig"):
+        self.config = config
+        self.logger = config.logger
+        self.path = f"{config.base_dir}/metrics.jsonl"
+        self._lock = threading.Lock()
+        self._jobs: Dict[tuple, int] = {}  # (tipo, status) -> quantidade
+        self._bytes: Dict[str, int] = {}  # tipo -> bytes
+        self._phases: Dict[tuple, List[float]] = {}  # (tipo, fase) -> [soma, quantidade]
+
+    def record(self, job: DownloadJob):
+        if not self.config.metrics_enabled and not self.config.metrics_prometheus_file:
+            return
+        entry = dict(job.to_dict(), ts=datetime.now().isoformat(timespec="seconds"))
+        with self._lock:
+            counter = (job.download_type, job.status)
+            self._jobs[counter] = self._jobs.get(counter, 0) + 1
+            self._bytes[job.download_type] = self._bytes.get(job.download_type, 0) + job.downloaded_bytes
+            for phase, seconds in job.spans.items():
+                totals = self._phases.setdefault((job.download_type, phase), [0.0, 0])
+                totals[0] += seconds
+                totals[1] += 1
+            try:
+                if self.config.metrics_enabled:
+                    self._append(entry)
+                if self.config.metrics_prometheus_file:
+                    self._write_prometheus(os.path.expanduser(self.config.metrics_prometheus_file))
+            except OSError as e:
+                self.logger.log(f"Falha ao gravar métricas: {e}", "WARNING", context="Metrics")
+
+    def _append(self, entry: dict):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.MAX_BYTES:
+            os.replace(self.path, self.path + ".1")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _write_prometheus(self, path: str):
+        lines = [
+            "# HELP ytd_downloads_total Downloads processados, por tipo e resultado.",
+            "# TYPE ytd_downloads_total counter",
+        ]
+        lines += [f'ytd_downloads_total{{type="{kind}",status="{status}"}} {count}'
+                  for (kind, status), count in sorted(self._jobs.items())]
+        lines += [
+            "# HELP ytd_download_bytes_total Bytes transferidos, por tipo.",
+            "# TYPE ytd_download_bytes_total counter",
+        ]
+        lines += [f'ytd_download_bytes_total{{type="{kind}"}} {total}' for kind, total in sorted(self._bytes.items())]
+        lines += [
+            "# HELP ytd_phase_seconds Tempo gasto em cada fase dos downloads.",
+            "# TYPE ytd_phase_seconds summary",
+        ]
+        for (kind, phase), (total, count) in sorted(self._phases.items()):
+            lines.append(f'ytd_phase_seconds_sum{{type="{kind}",phase="{phase}"}} {total:.6f}')
+            lines.append(f'ytd_phase_seconds_count{{type="{kind}",phase="{phase}"}} {count}')
+        # Escrita atômica: o node_exporter nunca lê um arquivo pela metade
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp, path)
+
+class DownloadDashboard:
+    """
+    Painel ao vivo (rich.live) dos downloads em andamento: uma linha por job ativo com
+    fase, bytes, velocidade e tempo restante, e um resumo com fila, concluídos, falhas
+    e velocidade total. É redesenhado por uma thread própria a cada `interval` segundos;
+    os hooks do yt-dlp só atualizam os contadores dos jobs.
+    """
+    PHASES = {
+        "queued": "na fila",
+        "extracting": "extraindo",
+        "downloading": "baixando",
+        "processing": "processando",
+        "finished": "concluído",
+        "failed": "falhou",
+    }
+
+    def __init__(self, jobs: List[DownloadJob], console: Console, title: str,
+                 theme_color: str = "cyan", interval: float = 0.25):
+        self.jobs = jobs
+        self.title = title
+        self.theme_color = theme_color
+        self.interval = interval
+        self.live = rich_live.Live(console=console, auto_refresh=False, transient=False)
+        self.console = self.live.console
+        self._stop = threading.Event()
+        self._thread = None
+
+    def render(self):
+        table = rich_table.Table(box=None, expand=True, show_header=True, header_style=f"bold {self.theme_color}")
+        table.add_column("Item", ratio=3, no_wrap=True, overflow="ellipsis")
+        table.add_column("Fase", width=11)
+        table.add_column("", ratio=2)
+        table.add_column("Bytes", justify="right", width=19)
+        table.add_column("Velocidade", justify="right", width=12)
+        table.add_column("Restante", justify="right", width=8)
+        counts = dict.fromkeys(self.PHASES, 0)
+        total_speed = 0.0
+        for job in self.jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+            if job.status not in ("extracting", "downloading", "processing"):
+                continue
+            done = job.downloaded_bytes
+            total = job.total_bytes
+            downloading = job.status == "downloading"
+            if downloading and job.speed:
+                total_speed += job.speed
+            table.add_row(
+                job.title or job.url,
+                self.PHASES[job.status],
+                rich_progress.ProgressBar(total=max(total, done) if total else None, completed=done,
+                                          pulse=not total and job.status != "processing"),
+                f"{format_size(done)}/{format_size(total)}" if job.files else "",
+                f"{format_size(job.speed)}/s" if downloading and job.speed else "",
+                format_duration(job.eta) if downloading and job.eta else "",
+            )
+        summary = (
+            f"[bold {self.theme_color}]{self.title}[/] | Na fila: {counts['queued']} | "
+            f"Em andamento: {counts['extracting'] + counts['downloading'] + counts['processing']} | "
+            f"[green]Concluídos: {counts['finished']}[/] | [red]Falhas: {counts['failed']}[/] | "
+            f"Total: {total_speed / (1024 * 1024):.2f} MB/s"
+        )
+        return Group(table, Text.from_markup(summary))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.live.update(self.render(), refresh=True)
+
+    def __enter__(self) -> "DownloadDashboard":
+        self.live.start()
+        self.live.update(self.render(), refresh=True)
+        self._thread = threading.Thread(target=self._run, name="dashboard", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.live.update(self.render(), refresh=True)
+        self.live.stop()
+
+class Downloader:
+    def __init__(self, config: DownloaderConfig):
+        self.config = config
+        self.logger = config.logger
+        self.console = Console()
+        self.download_queue: List[str] = []  # URLs enviadas ao pool e ainda não concluídas
+        self._executor_lock = threading.Lock()
+        self._executor_workers = config.max_concurrent_downloads
+        self.executor = ThreadPoolExecutor(max_workers=config.max_concurrent_downloads, thread_name_prefix="download")
+        self.metadata_cache = MetadataCache(config)
+        self.stream_cache = StreamCache(config)
+        self.audio_cache = AudioCache(config)
+        self.metrics = DownloadMetrics(config)
+        self.interactive = True  # False no modo de linha de comando: nenhuma pergunta é feita
+        self.on_exists = "ask"
+        self.archives = {'audio': DownloadArchive(config, 'audio'), 'video': DownloadArchive(config, 'video')}
+        self.library = MusicLibrary(config)
+        self.player = MpvPlayer(self.logger)
+        self.player.listeners.append(self._on_player_change)
+        self._player_changed = threading.Condition()
+        self._last_history_path = None
+        # Reprodução online: resolução das URLs de stream e fila com pré-carregamento
+        self._stream_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stream")
+        self._stream_local = threading.local()
+        self._stream_futures: Dict[str, Future] = {}
+        self._stream_futures_lock = threading.Lock()  # fila online e menu usam o dict em threads diferentes
+        # item no mpv -> (URL da página, título, stream resolvido ou None se o mpv recebeu a página)
+        self._stream_sources: Dict[str, tuple] = {}
+        # Cópia do áudio tocado online para o cache, uma música por vez; o mpv toca a cópia
+        self._cache_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-cache")
+        # URL da página -> {"future", "abort", "ready", "path"} da cópia em andamento
+        self._cache_fetches: Dict[str, dict] = {}
+        self._online_generation = 0
+        self.theme_color = config.theme_color
+
+    def check_mpv(self):
+        """
+        Verifica se o mpv está disponível no sistema.
+        """
+        return shutil.which('mpv') is not None
+
+    def get_title_from_url(self, url):
+        """
+        Usa yt-dlp para obter o título de um vídeo ou áudio URL sem fazer download.
+        """
+        info = self._extract_info(url)
+        if info:
+            return info.get("title", url)
+        return url
+
+    def _extract_info(self, url: str, fresh_formats: bool = False):
+        """
+        Extrai os metadados de uma URL sem baixar nem selecionar formatos (process=False).
+        O resultado pode ser entregue a process_ie_result para fazer o download sem
+        executar o extrator de novo. Consulta antes o cache de metadados; com
+        fresh_formats=True ignora entradas cujas URLs de formato já expiraram.
+        Retorna None se a extração falhar.
+        """
+        cached = self.metadata_cache.get(url_cache_key(url), fresh_formats=fresh_formats)
+        if cached is not None:
+            return cached
+        opts = {"quiet": True, "no_warnings": True}
+        if self.config.proxy_url:
+            opts['proxy'] = self.config.proxy_url
+        cookiefile = self.config.cookies.netscape_file()
+        if cookiefile:
+            opts['cookiefile'] = cookiefile
+        try:
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+        except Exception as e:
+            self.logger.log(f"Falha ao extrair informações de {url}: {e}", "WARNING", context="ExtractInfo")
+            return None
+        if info:
+            self.metadata_cache.put(info)
+        return info
+
+    STREAM_FORMAT = "bestaudio/best"
+    STREAM_PREFETCH = 3  # itens resolvidos à frente da faixa atual
+    CACHE_START_TIMEOUT = 5  # segundos até os primeiros bytes da cópia; depois, o mpv usa a URL
+
+    def _stream_ydl(self):
+        """
+        Instância do YoutubeDL por thread, reaproveitada para selecionar o formato de áudio.
+        """
+        ydl = getattr(self._stream_local, "ydl", None)
+        if ydl is None:
+            opts = {"quiet": True, "no_warnings": True, "format": self.STREAM_FORMAT}
+            if self.config.proxy_url:
+                opts['proxy'] = self.config.proxy_url
+            cookiefile = self.config.cookies.netscape_file()
+            if cookiefile:
+                opts['cookiefile'] = cookiefile
+            ydl = yt_dlp.YoutubeDL(opts)
+            self._stream_local.ydl = ydl
+        return ydl
+
+    def _resolve_stream(self, url: str) -> Optional[dict]:
+        """
+        Resolve a URL da página para a URL direta do melhor áudio, no próprio processo.
+        Retorna {"url", "title", "page_url", "user_agent"} ou None se não for possível.
+        Se o vídeo já foi baixado ou está no cache de áudio, "url" é o arquivo local;
+        URLs ainda válidas vêm do cache de streams. Nesses casos o extrator não é executado.
+        """
+        local = self._local_copy(url)
+        if local:
+            return local
+        cached_audio = self.audio_cache.lookup(url)
+        if cached_audio:
+            return {"url": cached_audio["path"], "title": cached_audio["title"], "page_url": url, "user_agent": None}
+        cached = self.stream_cache.get(url, self.STREAM_FORMAT)
+        if cached is not None:
+            return cached
+        info = self._extract_info(url, fresh_formats=True)
+        if not info or info.get('_type', 'video') != 'video':
+            return None
+        try:
+            selected = self._stream_ydl().process_ie_result(info, download=False)
+        except Exception as e:
+            self.logger.log(f"Falha ao resolver o stream de {url}: {e}", "WARNING", context="Stream")
+            return None
+        stream_url = selected.get('url')
+        if not stream_url:
+            return None
+        headers = selected.get('http_headers') or {}
+        stream = {
+            "url": stream_url,
+            "title": selected.get('title') or url,
+            "page_url": url,
+            "user_agent": headers.get("User-Agent"),
+        }
+        self.stream_cache.put(url, self.STREAM_FORMAT, stream)
+        return stream
+
+    def _local_copy(self, url: str) -> Optional[dict]:
+        """
+        Procura no arquivo de downloads (áudio e, depois, vídeo) uma cópia do vídeo da URL,
+        pelo ID canônico. Retorna no mesmo formato de _resolve_stream, ou None.
+        """
+        key = url_cache_key(url)
+        if not key:
+            return None
+        path = self.archives['audio'].lookup(key) or self.archives['video'].lookup(key)
+        if not path:
+            return None
+        self.logger.log(f"Tocando cópia local de {url}: {path}", "DEBUG", context="Stream")
+        return {
+            "url": path,
+            "title": os.path.splitext(os.path.basename(path))[0],
+            "page_url": url,
+            "user_agent": None,
+        }
+
+    def _stream_future(self, url: str) -> Future:
+        with self._stream_futures_lock:
+            future = self._stream_futures.get(url)
+            if future is None or (future.done() and future.result() is None):
+                future = self._stream_pool.submit(self._resolve_stream, url)
+                self._stream_futures[url] = future
+        return future
+
+    def _prefetch_streams(self, urls: List[str]):
+        for url in urls:
+            self._stream_future(url)
+
+    def _stream_item(self, url: str, title: Optional[str] = None) -> str:
+        """
+        Item para o mpv: a URL direta já resolvida ou, se falhar, a própria página
+        (o mpv então usa o hook do ytdl).
+        """
+        future = self._stream_future(url)
+        stream = future.result()
+        # Reproduções seguintes consultam o cache de streams, que respeita o expire= da URL
+        with self._stream_futures_lock:
+            if self._stream_futures.get(url) is future:
+                del self._stream_futures[url]
+        if not stream:
+            self._stream_sources[url] = (url, title or url, None)
+            if title:
+                self.player.titles[url] = title
+            return url
+        if stream["user_agent"] and self.player.running():
+            try:
+                self.player.command("set_property", "user-agent", stream["user_agent"])
+            except RuntimeError:
+                pass
+        item = stream["url"]
+        if self.audio_cache.enabled() and not os.path.isfile(item):
+            # O mpv toca a cópia do cache enquanto ela é baixada: o áudio vem uma vez só
+            item = self._cache_item(url, stream) or item
+        self._stream_sources[item] = (url, title or stream["title"], stream)
+        self.player.titles[item] = title or stream["title"]
+        return item
+
+    def _cache_fetch(self, url: str, stream: dict) -> dict:
+        """
+        Cópia para o cache da música em `url`, iniciada aqui se ainda não estiver em andamento.
+        """
+        fetch = self._cache_fetches.get(url)
+        if fetch is not None:
+            return fetch
+        fetch = {"abort": threading.Event(), "ready": threading.Event(), "path": None}
+
+        def started(path):
+            fetch["path"] = path
+            fetch["ready"].set()
+
+        def finished(future):
+            fetch["ready"].set()
+            if self._cache_fetches.get(url) is fetch:
+                del self._cache_fetches[url]
+
+        self._cache_fetches[url] = fetch
+        fetch["future"] = self._cache_pool.submit(self.audio_cache.fetch, url, stream, fetch["abort"], started)
+        fetch["future"].add_done_callback(finished)
+        return fetch
+
+    def _cache_item(self, url: str, stream: dict) -> Optional[str]:
+        """
+        Espera os primeiros bytes da cópia para o cache. Retorna o arquivo completo,
+        "appending://<arquivo>" se ele ainda estiver crescendo (o mpv espera pelos dados
+        novos) ou None se a cópia falhar ou não começar em CACHE_START_TIMEOUT segundos
+        (ex: na fila atrás de outras cópias); nesse caso ela é cancelada e o mpv usa a URL.
+        """
+        fetch = self._cache_fetch(url, stream)
+        future = fetch["future"]
+        if not fetch["ready"].wait(self.CACHE_START_TIMEOUT):
+            fetch["abort"].set()
+            future.cancel()
+            return None
+        if future.done():
+            return None if future.cancelled() else future.result()
+        return f"appending://{fetch['path']}"
+
+    def _cancel_cache_fetches(self, keep=()):
+        """
+        Interrompe as cópias para o cache das músicas fora de `keep` (URLs de página):
+        as que esperam na fila são canceladas e a que está baixando para no próximo bloco.
+        """
+        for url, fetch in list(self._cache_fetches.items()):
+            if url not in keep:
+                fetch["abort"].set()
+                fetch["future"].cancel()
+
+    def shutdown(self):
+        """
+        Encerra o trabalho em segundo plano da reprodução online sem esperar por ele.
+        """
+        self._online_generation += 1
+        self._cancel_cache_fetches()
+        with self._stream_futures_lock:
+            for future in self._stream_futures.values():
+                future.cancel()
+        self._stream_pool.shutdown(wait=False)
+        self._cache_pool.shutdown(wait=False)
+
+    def _save_current_to_library(self):
+        """
+        Move a música online que está tocando do cache de áudio para a pasta de músicas,
+        com título, artista e álbum do cache de metadados, e a registra como baixada.
+        """
+        path = self.player.state.get("path")
+        if path not in self._stream_sources:
+            self.console.print("[yellow]A música atual não veio da reprodução online.[/]")
+            return
+        page_url, title, stream = self._stream_sources[path]
+        key = url_cache_key(page_url)
+        if self._local_copy(page_url):
+            self.console.print("[yellow]Esta música já está na biblioteca.[/]")
+            return
+        if stream is None:
+            # O mpv recebeu a URL da página: não há URL direta de áudio para guardar
+            self.console.print("[yellow]O áudio desta música não foi resolvido; baixe-a pelo menu de downloads.[/]")
+            return
+        fetch = self._cache_fetches.get(page_url)
+        if fetch is None and not self.audio_cache.lookup(page_url):
+            if not self.audio_cache.enabled():
+                self.console.print("[yellow]Ative o cache de áudio online nas configurações para salvar músicas tocadas.[/]")
+                return
+            fetch = self._cache_fetch(page_url, stream)
+        if fetch is not None:
+            with self.console.status("Terminando de baixar o áudio..."):
+                wait_futures([fetch["future"]])
+        info = self.metadata_cache.get(key) or {}
+        tags = {
+            "title": info.get("track") or title,
+            "artist": info.get("artist") or info.get("uploader") or info.get("channel"),
+            "album": info.get("album"),
+        }
+        # Mesmo destino dos downloads de áudio (o yt-dlp expande o "~")
+        dest = self.audio_cache.promote(page_url, os.path.expanduser(self.config.audio_path), tags)
+        if not dest:
+            self.console.print("[red]Não foi possível salvar a música; veja o log.[/]")
+            return
+        self.archives['audio'].record(key, dest, "stream")
+        self.console.print(f"[green]Música salva em {dest}[/]")
+
+    def _on_player_change(self, player):
+        """
+        Listener do mpv (thread de IPC): acorda a fila online e registra no histórico
+        cada item online que começa a tocar.
+        """
+        with self._player_changed:
+            self._player_changed.notify_all()
+        path = player.state.get("path")
+        if path and path != self._last_history_path and path in self._stream_sources:
+            self._last_history_path = path
+            page_url, title, _ = self._stream_sources[path]
+            self.save_online_history(title, page_url)
+
+    def _feed_online_queue(self, generation: int, urls: List[str], titles: Dict[str, str]):
+        """
+        Acrescenta os próximos itens online ao mpv, mantendo no máximo STREAM_PREFETCH
+        itens resolvidos à frente da faixa atual. Termina se a fila for substituída.
+        """
+        for index, url in enumerate(urls):
+            while generation == self._online_generation and self.player.running():
+                state = self.player.now_playing(query_position=False)
+                if state["idle"] or state["count"] - (state["index"] or 0) < self.STREAM_PREFETCH:
+                    break
+                with self._player_changed:
+                    self._player_changed.wait(1)
+            if generation != self._online_generation or not self.player.running():
+                return
+            self._prefetch_streams(urls[index:index + self.STREAM_PREFETCH])
+            item = self._stream_item(url, titles.get(url))
+            if generation != self._online_generation:
+                return
+            try:
+                self.player.load([item], append=True)
+            except RuntimeError:
+                return
+
+    def ensure_mpv(self):
+        dep_manager = DependencyManager(self.logger)
+        if not dep_manager.check_mpv():
+            dep_manager.install_packages(['mpv'])
+        if not dep_manager.check_mpv():
+            console.print("[red]O mpv não está instalado e não pôde ser instalado automaticamente.[/]")
+            time.sleep(2)
+            return False
+        return True
+
+    def play_music_menu(self):
+        while True:
+            clear_screen()
+            mpv_status = "[green]Disponível[/]" if self.check_mpv() else "[red]Não Disponível[/]"
+            console.print(Panel.fit(
+                f"[bold {self.config.theme_color}]Reprodutor de Música[/]\n" +
+                f"[bold {self.config.theme_color}]Player MPV: {mpv_status} | Pasta: {self.config.audio_path}[/]",
+                border_style=self.config.theme_color
+            ))
+            choice = questionary.select(
+                "Escolha uma opção:",
+                choices=[
+                    {"name": "Reproduzir Música Online", "value": "online"},
+                    {"name": "Reproduzir Todas as Músicas Baixadas", "value": "play_all_local"},
+                    {"name": "Reproduzir Música Baixada", "value": "local"},
+                    *([{"name": f"Player: {self._now_playing_text()}", "value": "player"}]
+                      if not self.player.now_playing()["idle"] else []),
+                    {"name": "Voltar", "value": "back"}
+                ],
+                style=custom_style()
+            ).ask()
             if choice == "back":
                 break
+            elif choice == "player":
+                self.player_controls()
             elif choice == "online":
                 self.play_online_music_menu()
             elif choice == "local":
@@ -1006,25 +3652,14 @@ class Downloader:
     
     def play_all_downloaded_music(self):
         audio_dir = self.config.audio_path
-        exts = ['*.mp3', '*.m4a', '*.aac', '*.opus', '*.ogg', '*.wav', '*.flac']
-        files = []
-        for ext in exts:
-            files.extend(glob.glob(os.path.join(audio_dir, '**', ext), recursive=True))
-        files = sorted(files)
+        self._refresh_library(audio_dir)
+        files = [track["path"] for track in self.library.tracks(root=audio_dir)]
         clear_screen()
         if not files:
             console.print("[yellow]Nenhuma música encontrada na pasta de áudio.[/]")
             time.sleep(2)
             return
-        if not self.ensure_mpv():
-            return
-        for music_file in files:
-            clear_screen()
-            music_name = os.path.relpath(music_file, audio_dir)
-            console.print(f"[bold {self.config.theme_color}]Reproduzindo:[/] {music_name}")
-            time.sleep(0.5)
-            subprocess.run(['mpv', music_file])
-            clear_screen()
+        self._play(files, titles=self._track_titles(audio_dir))
 
     def play_online_music_menu(self):
         while True:
@@ -1041,82 +3676,305 @@ class Downloader:
                     {"name": "Histórico", "value": "history"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "back":
                 break
             elif choice == "url":
                 url = questionary.text(
                     "Digite a URL da música (YouTube, mp3, etc):",
-                    style=custom_style
+                    style=custom_style()
                 ).ask()
                 if url and url.strip():
                     self._play_online_music(url)
             elif choice == "history":
-                history = self.get_online_history()
-                if not history:
+                if not self.get_online_history():
                     console.print("[yellow]Histórico vazio.[/]")
                     time.sleep(2)
                     continue
-                # Display titles and play corresponding URL
-                choices = [{"name": item["title"], "value": item["url"]} for item in history]
-                # Only show "Back" in music selection, not in delete menu
-                choices.append({"name": "Voltar", "value": "back"})
-                url = questionary.select(
-                    "Selecione uma música do histórico:",
-                    choices=choices,
-                    style=custom_style
-                ).ask()
-                if url and url != "back":
-                    self._play_online_music(url)
+                picked = pick_from_history(self.config.history, "Selecione uma música do histórico")
+                if picked:
+                    # As músicas seguintes do histórico (mais antigas) formam a fila
+                    history = self.config.history.search()
+                    keys = [OnlineHistory.entry_key(item) for item in history]
+                    key = OnlineHistory.entry_key(picked[0])
+                    following = history[keys.index(key) + 1:] if key in keys else []
+                    self._play_online_music(
+                        picked[0]["url"],
+                        upcoming=[item["url"] for item in following],
+                        titles={item["url"]: item.get("title") for item in [picked[0]] + following}
+                    )
 
-    def _play_online_music(self, url):
+    def _play_online_music(self, url, upcoming: Optional[List[str]] = None, titles: Optional[Dict[str, str]] = None):
+        """
+        Toca uma URL online a partir da URL direta do áudio, resolvida pelo yt-dlp no
+        próprio processo. Os itens de `upcoming` (ex: o restante do histórico) entram
+        na fila e são resolvidos em segundo plano, poucos de cada vez, enquanto a
+        faixa atual toca.
+        """
         if not self.ensure_mpv():
             return
-        title = self.get_title_from_url(url)
-        if title:
-            self.save_online_history(title, url)
-        clear_screen()
-        console.print(f"[bold {self.config.theme_color}]Reproduzindo:[/] {title}")
-        subprocess.run(['mpv', url])
-        clear_screen()
+        titles = dict(titles or {})
+        upcoming = list(upcoming or [])
+        self._prefetch_streams([url] + upcoming[:self.STREAM_PREFETCH])
+        # Pergunta antes de baixar: ao substituir a fila, as cópias da fila antiga param
+        append = self._choose_queue_mode()
+        if append is None:
+            return
+        if not append:
+            self._online_generation += 1
+            self._cancel_cache_fetches()
+        with self.console.status("Carregando..."):
+            # O mpv abre enquanto a URL é resolvida
+            self.player.start()
+            item = self._stream_item(url, titles.get(url))
+        page_url, title, _ = self._stream_sources[item]
+        if os.path.isfile(item):
+            self.console.print(f"[green]Tocando a cópia já baixada: {item}[/]")
+        self.save_online_history(title, page_url)
+        self._last_history_path = item
+        mode = self._send_to_player([item], append=append)
+        if mode is None:
+            return
+        if upcoming:
+            threading.Thread(
+                target=self._feed_online_queue,
+                args=(self._online_generation, upcoming, titles),
+                name="online-queue",
+                daemon=True
+            ).start()
+        self.player_controls()
+
+    def _refresh_library(self, audio_dir: str):
+        """
+        Atualiza o índice da biblioteca; quando há muitas tags a ler (primeira varredura),
+        mostra o progresso. Ctrl+C interrompe a leitura, que continua da próxima vez.
+        """
+        self.library.refresh(audio_dir, read_tags=False)
+        pending = self.library.pending_count(audio_dir)
+        if not pending:
+            return
+        if pending < 20:
+            self.library.read_pending_tags(audio_dir)
+            return
+        try:
+            with rich_progress.Progress(
+                rich_progress.TextColumn("[bold]{task.description}"),
+                rich_progress.BarColumn(),
+                rich_progress.MofNCompleteColumn(),
+                rich_progress.TimeRemainingColumn(),
+                transient=True,
+                console=self.console
+            ) as progress:
+                task = progress.add_task("Lendo tags das músicas", total=pending)
+                self.library.read_pending_tags(
+                    audio_dir, progress=lambda done, total: progress.update(task, completed=done)
+                )
+        except KeyboardInterrupt:
+            self.console.print("[yellow]Leitura das tags interrompida; ela continua na próxima vez.[/]")
+            time.sleep(1)
+
+    def _track_titles(self, audio_dir: str) -> Dict[str, str]:
+        return {track["path"]: self._track_label(track, audio_dir) for track in self.library.tracks(root=audio_dir)}
+
+    def _play(self, items: List[str], titles: Optional[Dict[str, str]] = None, start: int = 0):
+        """
+        Toca os itens no mpv persistente e abre os controles do player.
+        """
+        if self._send_to_player(items, titles, start) is not None:
+            self.player_controls()
+
+    def _choose_queue_mode(self) -> Optional[bool]:
+        """
+        Se algo já estiver tocando, pergunta se os novos itens substituem a fila ou vão
+        para o fim dela. Retorna True (fim da fila), False (substituir) ou None (voltar).
+        """
+        if not self.player.running() or self.player.now_playing()["idle"]:
+            return False
+        action = questionary.select(
+            "Já há músicas tocando:",
+            choices=[
+                {"name": "Tocar agora", "value": "now"},
+                {"name": "Adicionar ao fim da fila", "value": "queue"},
+                {"name": "Voltar", "value": "back"}
+            ],
+            style=custom_style()
+        ).ask()
+        if action not in ("now", "queue"):
+            return None
+        return action == "queue"
+
+    def _send_to_player(self, items: List[str], titles: Optional[Dict[str, str]] = None, start: int = 0,
+                        append: Optional[bool] = None):
+        """
+        Envia os itens ao mpv persistente. Sem `append`, pergunta se deve substituir a
+        fila ou ir para o fim dela quando algo já estiver tocando. Retorna "replace",
+        "append" ou None se nada foi enviado ao player.
+        """
+        if not items or not self.ensure_mpv():
+            return None
+        if not self.player.start():
+            # mpv sem suporte a IPC: reprodução simples, um processo por faixa
+            for item in items[start:]:
+                clear_screen()
+                console.print(f"[bold {self.config.theme_color}]Reproduzindo:[/] {(titles or {}).get(item, item)}")
+                subprocess.run(['mpv', item])
+            clear_screen()
+            return None
+        if append is None:
+            append = self._choose_queue_mode()
+            if append is None:
+                return None
+        if not append:
+            # Uma fila online anterior deixa de alimentar o player e de ser copiada para o cache
+            self._online_generation += 1
+            self._cancel_cache_fetches(keep={self._stream_sources.get(item, (item,))[0] for item in items})
+        try:
+            if append:
+                self.player.load(items[start:], append=True, titles=titles)
+            else:
+                self.player.load(items, start=start, titles=titles)
+        except RuntimeError as e:
+            self.logger.log(f"Erro ao enviar músicas ao mpv: {e}", "ERROR", context="Player", exc=e)
+            return None
+        return "append" if append else "replace"
+
+    def _now_playing_text(self, query_position: bool = True) -> str:
+        state = self.player.now_playing(query_position)
+        if state["idle"]:
+            return "Nada tocando"
+        icon = "⏸" if state["paused"] else "▶"
+        position = f"{format_duration(state['position'])}/{format_duration(state['duration'])}"
+        queue_pos = f" ({state['index']}/{state['count']})" if state["index"] else ""
+        return f"{icon} {state['title']} [{position}]{queue_pos}"
+
+    def player_controls(self):
+        """
+        Controles do player persistente. Sair deste menu não interrompe a música.
+        """
+        while True:
+            clear_screen()
+            console.print(Panel.fit(
+                f"[bold {self.config.theme_color}]Player[/]\n" +
+                f"[bold {self.config.theme_color}]A música continua tocando ao voltar para o menu[/]",
+                border_style=self.config.theme_color
+            ))
+            status_choice = questionary.Choice(title=self._now_playing_text(), value="refresh")
+            question = questionary.select(
+                "Controles:",
+                choices=[
+                    status_choice,
+                    {"name": "Pausar/Continuar", "value": "pause"},
+                    {"name": "Próxima", "value": "next"},
+                    {"name": "Anterior", "value": "prev"},
+                    {"name": "Avançar 10s", "value": "forward"},
+                    {"name": "Voltar 10s", "value": "backward"},
+                    {"name": "Salvar na biblioteca", "value": "save"},
+                    {"name": "Parar e limpar a fila", "value": "stop"},
+                    {"name": "Voltar ao menu", "value": "back"}
+                ],
+                style=custom_style()
+            )
+            def on_change(player):
+                # Troca de faixa/pausa atualiza a linha de status sem redesenhar o menu
+                status_choice.title = self._now_playing_text(query_position=False)
+                question.application.invalidate()
+            self.player.listeners.append(on_change)
+            try:
+                choice = question.ask()
+            finally:
+                self.player.listeners.remove(on_change)
+            actions = {
+                "pause": self.player.toggle_pause,
+                "next": self.player.next,
+                "prev": self.player.prev,
+                "forward": lambda: self.player.seek(10),
+                "backward": lambda: self.player.seek(-10),
+                "stop": self.player.stop,
+            }
+            if choice in actions:
+                try:
+                    actions[choice]()
+                except RuntimeError as e:
+                    self.logger.log(f"Comando do player falhou: {e}", "WARNING", context="Player")
+                if choice == "stop":
+                    break
+            elif choice == "save":
+                self._save_current_to_library()
+                time.sleep(2)
+            elif choice != "refresh":
+                break
+
+    def _track_label(self, track: dict, audio_dir: str) -> str:
+        if track.get("title"):
+            name = f"{track['artist']} - {track['title']}" if track.get("artist") else track["title"]
+        else:
+            name = os.path.relpath(track["path"], audio_dir)
+        return f"{name} ({format_duration(track.get('duration'))})"
 
     def play_downloaded_music_menu(self):
+        sort = "path"
+        sort_names = {"path": "pasta", "artist": "artista", "album": "álbum", "duration": "duração", "recent": "mais recentes"}
+        filters = {}
         while True:
             audio_dir = self.config.audio_path
-            exts = ['*.mp3', '*.m4a', '*.aac', '*.opus', '*.ogg', '*.wav', '*.flac']
-            files = []
-            for ext in exts:
-                files.extend(glob.glob(os.path.join(audio_dir, '**', ext), recursive=True))
-            files = sorted(files)
+            self._refresh_library(audio_dir)
+            tracks = self.library.tracks(sort=sort, root=audio_dir, **filters)
             clear_screen()
             
-            file_count = len(files)
+            file_count = len(tracks)
+            filter_text = " | ".join(f"{'Artista' if k == 'artist' else 'Álbum'}: {v or 'Desconhecido'}" for k, v in filters.items())
             console.print(Panel.fit(
                 f"[bold {self.config.theme_color}]Reproduzir Músicas Baixadas[/]\n" +
-                f"[bold {self.config.theme_color}]Total de Arquivos: {file_count} | Pasta: {audio_dir}[/]",
+                f"[bold {self.config.theme_color}]Total de Arquivos: {file_count} | Pasta: {audio_dir} | Ordem: {sort_names[sort]}[/]" +
+                (f"\n[bold {self.config.theme_color}]{filter_text}[/]" if filter_text else ""),
                 border_style=self.config.theme_color
             ))
-            if not files:
+            if not tracks and not filters:
                 console.print("[yellow]Nenhuma música baixada encontrada na sua pasta de áudio.[/]")
                 time.sleep(2)
                 break
-            choices = [{"name": os.path.relpath(f, audio_dir), "value": f} for f in files]
+            choices = [{"name": self._track_label(track, audio_dir), "value": track["path"]} for track in tracks]
+            choices.append(questionary.Separator())
+            choices.append({"name": "Ordenar por...", "value": "sort"})
+            choices.append({"name": "Filtrar por artista", "value": "artist"})
+            choices.append({"name": "Filtrar por álbum", "value": "album"})
+            if filters:
+                choices.append({"name": "Remover filtro", "value": "clear"})
+            if not self.player.now_playing()["idle"]:
+                choices.append({"name": "Player (tocando agora)", "value": "player"})
             choices.append({"name": "Voltar", "value": "back"})
             selected = questionary.select(
                 "Escolha um arquivo para reproduzir:",
                 choices=choices,
-                style=custom_style
+                style=custom_style()
             ).ask()
-            if selected and selected != "back":
-                if not self.ensure_mpv():
-                    continue
-                clear_screen()
-                music_name = os.path.relpath(selected, audio_dir)
-                console.print(f"[bold {self.config.theme_color}]Reproduzindo:[/] {music_name}")
-                subprocess.run(['mpv', selected])
-                clear_screen()
-            elif selected == "back":
+            if selected == "sort":
+                sort = questionary.select(
+                    "Ordenar por:",
+                    choices=[{"name": name.capitalize(), "value": key} for key, name in sort_names.items()],
+                    style=custom_style()
+                ).ask() or sort
+            elif selected in ("artist", "album"):
+                groups = self.library.groups(selected, root=audio_dir)
+                value = questionary.select(
+                    "Escolha o artista:" if selected == "artist" else "Escolha o álbum:",
+                    choices=[{"name": f"{name or 'Desconhecido'} ({count})", "value": [name]} for name, count in groups]
+                    + [{"name": "Voltar", "value": "back"}],
+                    style=custom_style()
+                ).ask()
+                if value and value != "back":
+                    filters = {selected: value[0]}
+            elif selected == "clear":
+                filters = {}
+            elif selected == "player":
+                self.player_controls()
+            elif selected and selected != "back":
+                # Toca a lista exibida a partir da faixa escolhida, sem pausas entre as faixas
+                paths = [track["path"] for track in tracks]
+                titles = {track["path"]: self._track_label(track, audio_dir) for track in tracks}
+                self._play(paths, titles=titles, start=paths.index(selected))
+            else:
                 break
 
     def _get_video_format_config(self):
@@ -1170,7 +4028,7 @@ class Downloader:
             format_choice = questionary.select(
                 "Escolha um formato:",
                 choices=formats,
-                style=custom_style
+                style=custom_style()
             ).ask()
             if format_choice == "back":
                 return None
@@ -1179,31 +4037,79 @@ class Downloader:
     def is_valid_url(self, url: str) -> bool:
         return url.strip() and ('youtube.com' in url or 'youtu.be' in url or url.startswith("http"))
 
-    def progress_hook(self, d):
-        if self.progress is None or self.current_task is None:
-            return
+    def _make_progress_hook(self, job: DownloadJob):
+        """
+        Cria o hook de progresso do yt-dlp ligado a um job específico.
+        """
+        def hook(d):
+            self.progress_hook(job, d)
+        return hook
+
+    # Nome de cada pós-processador (pp_key do yt-dlp) nas métricas
+    POSTPROCESSOR_PHASES = {
+        "Merger": "merge",
+        "ExtractAudio": "FFmpegExtractAudio",
+        "Metadata": "FFmpegMetadata",
+        "VideoRemuxer": "FFmpegVideoRemuxer",
+        "EmbedThumbnail": "EmbedThumbnail",
+        "MoveFiles": "move",
+    }
+
+    def _make_postprocessor_hook(self, job: DownloadJob):
+        """
+        Hook de pós-processamento do yt-dlp: mede o tempo de cada pós-processador do job.
+        """
+        def hook(d):
+            job.end("extraction")
+            phase = self.POSTPROCESSOR_PHASES.get(d.get('postprocessor'), d.get('postprocessor') or "postprocess")
+            if d['status'] == 'started':
+                job.status = "processing"
+                job.begin(phase)
+            elif d['status'] == 'finished':
+                job.end(phase)
+        return hook
+
+    PROGRESS_INTERVAL = 0.25  # segundos entre redesenhos do painel de downloads
+
+    def progress_hook(self, job: DownloadJob, d):
+        """
+        Atualiza os contadores do job; o painel de downloads os lê na própria thread.
+        """
+        filename = d.get('filename') or d.get('tmpfilename') or ''
+        job.end("extraction")
         if d['status'] == 'downloading':
-            try:
-                progress = float(d['_percent_str'].replace('%', ''))
-                self.progress.update(self.current_task, completed=progress)
-            except:
-                pass
+            now = time.time()
+            job.begin("transfer", now)
+            if job.first_byte_at is None:
+                job.first_byte_at = now
+            job.status = "downloading"
+            job.files[filename] = [d.get('downloaded_bytes'), d.get('total_bytes') or d.get('total_bytes_estimate')]
+            job.speed = d.get('speed')
+            job.eta = d.get('eta')
         elif d['status'] == 'finished':
-            self.progress.update(self.current_task, description="[yellow]Processando arquivo...")
+            job.download_finished_at = time.time()
+            job.end("transfer", job.download_finished_at)
+            job.status = "processing"
+            total = d.get('total_bytes') or d.get('downloaded_bytes')
+            if total:
+                job.files[filename] = [total, total]
+            job.speed = job.eta = None
 
-    def handle_playlist(self, url: str):
-        if "playlist" not in url.lower():
+    def handle_playlist(self, url: str, is_playlist: bool = False):
+        if not is_playlist and "playlist" not in url.lower():
+            return None
+        if not self.interactive:
             return None
         console.print("\n[yellow]Playlist detected![/]")
         download_all = questionary.confirm(
             "Download the entire playlist?",
             default=True,
-            style=custom_style
+            style=custom_style()
         ).ask()
         if not download_all:
             items = questionary.text(
                 "Enter item numbers (e.g. 1,3,5-7):",
-                style=custom_style
+                style=custom_style()
             ).ask()
             return items
         return None
@@ -1220,39 +4126,18 @@ class Downloader:
                             subprocess.Popen([player, sound_file], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
                             break
                     else:
-                        print('\a')  # beep padrão como fallback
+                        print('\a', file=sys.stderr)  # beep padrão como fallback (a saída padrão pode ser o --json)
                 except Exception:
-                    print('\a')
+                    print('\a', file=sys.stderr)
             else:
-                print('\a')
+                print('\a', file=sys.stderr)
 
     def save_online_history(self, title: str, url: str):
         """
         Salva uma entrada no histórico de músicas reproduzidas online.
         """
         try:
-            history = []
-            if os.path.exists(HISTORY_FILE_ONLINE):
-                with open(HISTORY_FILE_ONLINE, "r", encoding="utf-8") as f:
-                    try:
-                        history = json.load(f)
-                    except:
-                        history = []
-            
-            # Adiciona a nova entrada
-            entry = {
-                "title": title,
-                "url": url,
-                "timestamp": datetime.now().isoformat()
-            }
-            history.append(entry)
-            
-            # Mantém apenas os últimos 50 itens
-            if len(history) > 50:
-                history = history[-50:]
-            
-            with open(HISTORY_FILE_ONLINE, "w", encoding="utf-8") as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
+            self.config.history.add(title, url)
         except Exception as e:
             self.logger.log(f"Erro ao salvar histórico online: {e}", "ERROR", context="SaveOnlineHistory")
 
@@ -1261,36 +4146,62 @@ class Downloader:
         Obtém o histórico de músicas reproduzidas online.
         """
         try:
-            if os.path.exists(HISTORY_FILE_ONLINE):
-                with open(HISTORY_FILE_ONLINE, "r", encoding="utf-8") as f:
-                    history = json.load(f)
-                    # Remove duplicatas mantendo a ordem mais recente
-                    seen = set()
-                    unique_history = []
-                    for item in reversed(history):
-                        key = (item.get("title"), item.get("url"))
-                        if key not in seen:
-                            unique_history.append(item)
-                            seen.add(key)
-                    return list(reversed(unique_history))
+            return self.config.history.entries()
         except Exception as e:
             self.logger.log(f"Erro ao carregar histórico online: {e}", "ERROR", context="GetOnlineHistory")
         return []
 
-    def _process_download(self, url: str, options: dict, download_type: str):
+    def _process_download(self, job: DownloadJob):
+        job.started_at = time.time()
+        job.status = "extracting"
+        # Termina no primeiro hook (progresso ou pós-processamento) ou ao fim do yt-dlp
+        job.begin("extraction", job.started_at)
+        options = dict(job.options)
+        options['progress_hooks'] = [self._make_progress_hook(job)]
+        options['postprocessor_hooks'] = [self._make_postprocessor_hook(job)]
         try:
             with yt_dlp.YoutubeDL(options) as ydl:
-                info = ydl.extract_info(url, download=True)
+                if job.info is not None:
+                    info = ydl.process_ie_result(job.info, download=True)
+                else:
+                    info = ydl.extract_info(job.url, download=True)
+                job.end("extraction")
                 title = info.get('title', 'Unknown Title')
-                if self.config.auto_delete_temp:
-                    cleanup_temp_files(
-                        self.config.audio_path if download_type == 'audio' else self.config.video_path,
-                        title
-                    )
-                self.play_notification()
-                return True, title
+                job.title = title
+                if not info.get('requested_downloads') and info_cache_key(info) in self.archives[job.download_type]:
+                    # Pulado pelo yt-dlp por já constar no arquivo de downloads
+                    job.success, job.result = True, f"{title} (já baixado)"
+                else:
+                    job.begin("cleanup")
+                    self._record_download(job, info)
+                    if self.config.auto_delete_temp:
+                        cleanup_temp_files(
+                            self.config.audio_path if job.download_type == 'audio' else self.config.video_path,
+                            title
+                        )
+                    job.end("cleanup")
+                    job.success, job.result = True, title
         except Exception as e:
-            return False, str(e)
+            job.success, job.result = False, str(e)
+        # Em caso de erro, o tempo até a falha fica na fase em que ela ocorreu
+        job.end_all()
+        job.finished_at = time.time()
+        job.status = "finished" if job.success else "failed"
+        self.metrics.record(job)
+        return job.success, job.result
+
+    def _record_download(self, job: DownloadJob, info: dict):
+        """
+        Registra o arquivo final de um download concluído no arquivo de downloads.
+        """
+        key = info_cache_key(info)
+        downloads = info.get('requested_downloads') or []
+        if not key or not downloads:
+            return
+        filepath = downloads[-1].get('filepath')
+        job.filepath = filepath
+        if filepath and os.path.exists(filepath):
+            self.archives[job.download_type].record(key, filepath, info.get('format_id'))
 
     def _file_exists(self, output_path, title, ext_list):
         """
@@ -1302,6 +4213,17 @@ class Downloader:
                 return candidate
         return None
 
+    def _should_overwrite(self, filepath) -> bool:
+        """
+        Decide se um arquivo existente deve ser sobrescrito, segundo on_exists
+        ("ask", "skip" ou "overwrite"). Sem terminal interativo, nunca pergunta.
+        """
+        if self.on_exists == "overwrite":
+            return True
+        if self.on_exists == "skip" or not self.interactive:
+            return False
+        return bool(self._interactive_overwrite(filepath))
+
     def _interactive_overwrite(self, filepath):
         """
         Exibe um menu interativo perguntando se o usuário deseja sobrescrever o arquivo existente.
@@ -1313,7 +4235,7 @@ class Downloader:
                 {"name": "Sim, sobrescrever", "value": True},
                 {"name": "Não, cancelar", "value": False}
             ],
-            style=custom_style
+            style=custom_style()
         ).ask()
         return choice
 
@@ -1324,9 +4246,9 @@ class Downloader:
         """
         ok, msg = validate_path(base_path, must_exist=True, write=True, context=context)
         if not ok:
-            console.print(Panel(f"[red]Erro: {msg}[/]", title="Erro de Caminho", border_style="red"))
+            self.console.print(Panel(f"[red]Erro: {msg}[/]", title="Erro de Caminho", border_style="red"))
             self.logger.log(f"{action.capitalize()} falhou: {msg}", "ERROR", context=context)
-            time.sleep(2)
+            self._pause(2)
             return False
         return True
 
@@ -1338,7 +4260,6 @@ class Downloader:
     def _build_audio_options(self, output_path, audio_format):
         opts = {
             'format': 'bestaudio/best',
-            'cookiefile': self.config.cookie_file,
             'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
             'postprocessors': [
                 {
@@ -1349,21 +4270,25 @@ class Downloader:
                 {'key': 'EmbedThumbnail'},
                 {'key': 'FFmpegMetadata'},
             ],
-            'progress_hooks': [self.progress_hook],
             'writethumbnail': True,
             'embedthumbnail': True,
             'convert-thumbnails': True,
             'quiet': True,
-            'no_warnings': True
+            'no_warnings': True,
+            # O progresso é desenhado pelos hooks a partir dos bytes; o yt-dlp não
+            # precisa formatar nem imprimir a própria barra
+            'noprogress': True
         }
         if self.config.proxy_url:
             opts['proxy'] = self.config.proxy_url
+        cookiefile = self.config.cookies.netscape_file()
+        if cookiefile:
+            opts['cookiefile'] = cookiefile
         return opts
 
     def _build_video_options(self, output_path, video_format):
         opts = {
             'format': video_format['format'],
-            'cookiefile': self.config.cookie_file,
             'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
             'merge_output_format': 'mp4',
             'writesubtitles': self.config.download_subtitles,
@@ -1373,159 +4298,290 @@ class Downloader:
                 {'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'},
                 {'key': 'FFmpegMetadata'},
             ],
-            'progress_hooks': [self.progress_hook],
             'writethumbnail': True,
             'embedthumbnail': True,
             'convert-thumbnails': True,
             'merge_output_format': 'mp4',
             'quiet': True,
-            'no_warnings': True
+            'no_warnings': True,
+            # O progresso é desenhado pelos hooks a partir dos bytes; o yt-dlp não
+            # precisa formatar nem imprimir a própria barra
+            'noprogress': True
         }
         if self.config.proxy_url:
             opts['proxy'] = self.config.proxy_url
+        cookiefile = self.config.cookies.netscape_file()
+        if cookiefile:
+            opts['cookiefile'] = cookiefile
         return opts
 
     def download_audio(self, url: str, playlist_items: str = None):
-        if "tiktok.com" in url.lower():
-            cookie_valid = self.config._validate_tiktok_cookie()
-            if cookie_valid:
-                console.print("[green]Cookies do TikTok são válidos![/]")
-            else:
-                console.print("[red]Aviso: Cookies do TikTok são inválidos ou expiraram! Você pode não conseguir baixar vídeos privados.[/]")
-            time.sleep(1)
-        
+        self.download_urls([url], 'audio', playlist_items=playlist_items)
+
+    def download_video(self, url: str, playlist_items: str = None):
+        self.download_urls([url], 'video', playlist_items=playlist_items)
+
+    def _pause(self, seconds: float):
+        # Pausas só fazem sentido para quem está olhando o menu
+        if self.interactive:
+            time.sleep(seconds)
+
+    def download_urls(self, urls: List[str], download_type: str, playlist_items: str = None) -> List[DownloadJob]:
+        """
+        Prepara os jobs de download de uma ou mais URLs e os executa no pool de downloads.
+        Playlists são expandidas em um job por item. Retorna todos os jobs, inclusive os pulados.
+        """
+        # A validação dos cookies do TikTok roda em paralelo com a preparação dos downloads
+        tiktok_check = None
+        if any("tiktok.com" in url.lower() for url in urls):
+            tiktok_check = self.config.cookie_validator.check_async(['tiktok'])['tiktok']
+
         # Usar qualidade pré-configurada ao invés de mostrar seletor
-        audio_format = {
-            "format": self.config.default_audio_format,
-            "quality": self.config.default_audio_quality
-        }
-        
-        clear_screen()
-        console.print(f"[{self.config.theme_color}]Usando configuração de áudio:[/] {audio_format['format'].upper()} - {audio_format['quality']}")
-        time.sleep(1)
-        
-        if not self.is_valid_url(url):
-            console.print("[red]URL inválida! Retornando ao menu...[/]")
-            time.sleep(2)
-            return
-            console.print("[red]URL inválida! Retornando ao menu...[/]")
-            time.sleep(2)
-            return
-        output_path = self._build_output_path(self.config.audio_path)
-        if not self._validate_and_feedback(self.config.audio_path, context="DownloadAudio", action="audio download"):
-            return
-        # Obter título antes do download
-        title = self.get_title_from_url(url)
-        # Verificar se arquivo já existe
-        ext = audio_format['format']
-        # Considerar possíveis extensões de áudio
-        ext_list = [ext, "mp3", "m4a", "aac", "opus", "ogg", "wav", "flac"]
-        # Substituir variáveis do yt-dlp por valores reais para checar existência
-        real_output_path = output_path
-        if "%(uploader)s" in real_output_path or "%(playlist_title)s" in real_output_path:
-            real_output_path = self.config.audio_path  # fallback para pasta base
-        existing_file = self._file_exists(real_output_path, title, ext_list)
-        if existing_file:
-            if not self._interactive_overwrite(existing_file):
-                console.print("[yellow]Download cancelado pelo usuário.[/]")
-                time.sleep(2)
-                return
-        options = self._build_audio_options(output_path, audio_format)
-        if playlist_items:
-            options['playlist_items'] = playlist_items
+        if download_type == 'audio':
+            media_format = {
+                "format": self.config.default_audio_format,
+                "quality": self.config.default_audio_quality
+            }
+            base_path = self.config.audio_path
+            context = "DownloadAudio"
         else:
-            playlist_items_from_url = self.handle_playlist(url)
-            if playlist_items_from_url:
-                options['playlist_items'] = playlist_items_from_url
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        ) as progress:
-            self.progress = progress
-            self.current_task = progress.add_task(
-                f"[{self.config.theme_color}]Baixando...", 
-                total=100
-            )
-            success, result = self._process_download(url, options, 'audio')
-            if success:
-                progress.update(self.current_task, description="[green]Download concluído!")
-                self.logger.log(f"Download de áudio concluído: {result}")
-                console.print(f"\n[bold green]✓[/] Baixado: {result}")
+            media_format = self._get_video_format_config()
+            base_path = self.config.video_path
+            context = "DownloadVideo"
+
+        if self.interactive:
+            clear_screen()
+        if download_type == 'audio':
+            self.console.print(f"[{self.config.theme_color}]Usando configuração de áudio:[/] {media_format['format'].upper()} - {media_format['quality']}")
+        else:
+            self.console.print(f"[{self.config.theme_color}]Usando configuração de vídeo:[/] {self.config.default_video_quality}")
+        self._pause(1)
+
+        valid_urls = [url for url in urls if self.is_valid_url(url)]
+        if not valid_urls:
+            self.console.print("[red]URL inválida! Retornando ao menu...[/]" if self.interactive else "[red]Nenhuma URL válida.[/]")
+            self._pause(2)
+            return []
+        output_path = self._build_output_path(base_path)
+        if not self._validate_and_feedback(base_path, context=context, action=f"{download_type} download"):
+            return []
+        # Uma URL inválida (ex: uma linha ruim do --batch) não descarta as outras
+        jobs = []
+        for url in urls:
+            if not self.is_valid_url(url):
+                self.console.print(f"[red]URL inválida, ignorada:[/] {url}")
+                jobs.append(DownloadJob(url, {}, download_type).fail("URL inválida"))
+        for url in valid_urls:
+            jobs.extend(self._prepare_jobs(url, download_type, media_format, output_path, playlist_items))
+        if tiktok_check is not None:
+            if tiktok_check.result():
+                self.console.print("[green]Cookies do TikTok são válidos![/]")
             else:
-                progress.update(self.current_task, description="[red]Erro no download!")
-                self.logger.log(f"Erro no download de áudio: {result}", "ERROR")
-                console.print(f"\n[red]Erro:[/] {result}")
-        time.sleep(2)
+                self.console.print("[red]Aviso: Cookies do TikTok são inválidos ou expiraram! Você pode não conseguir baixar vídeos privados.[/]")
+            self._pause(1)
+        if any(job.status == "queued" for job in jobs):
+            self._run_download_jobs(jobs, download_type)
+        self._pause(2)
+        return jobs
 
-    def download_video(self, url: str, playlist_items: str = None):
-        if "tiktok.com" in url.lower():
-            cookie_valid = self.config._validate_tiktok_cookie()
-            if cookie_valid:
-                console.print("[green]Cookies do TikTok são válidos![/]")
+    def _build_options(self, download_type, output_path, media_format):
+        if download_type == 'audio':
+            opts = self._build_audio_options(output_path, media_format)
+        else:
+            opts = self._build_video_options(output_path, media_format)
+        # Itens já registrados são pulados pelo próprio yt-dlp (ex: ao repetir uma playlist)
+        opts['download_archive'] = self.archives[download_type]
+        return opts
+
+    def _prepare_jobs(self, url, download_type, media_format, output_path, playlist_items=None):
+        """
+        Monta a lista de jobs de uma URL, fazendo as perguntas interativas
+        (playlist e sobrescrita) antes de qualquer download começar.
+        """
+        archive = self.archives[download_type]
+        info = None
+        extraction_time = 0.0
+        is_playlist = bool(playlist_items) or "playlist" in url.lower()
+        # Consulta indexada ao arquivo de downloads, antes de qualquer acesso à rede
+        key = None if is_playlist else url_cache_key(url)
+        existing_file = archive.lookup(key)
+        if not is_playlist and existing_file is None:
+            # Extração única: o mesmo info dict serve para a checagem de duplicatas e para o download
+            started = time.time()
+            info = self._extract_info(url)
+            extraction_time = time.time() - started
+            is_playlist = bool(info) and info.get('_type') in ('playlist', 'multi_video')
+            if info and not is_playlist:
+                key = key or info_cache_key(info)
+                existing_file = archive.lookup(key)
+        if is_playlist:
+            items = playlist_items or self.handle_playlist(url, is_playlist=True)
+            entries = self._expand_playlist(url, items)
+            if entries is not None:
+                jobs = []
+                skipped = 0
+                for entry_url, playlist_title, entry_key in entries:
+                    existing_entry = archive.lookup(entry_key)
+                    if existing_entry:
+                        skipped += 1
+                        jobs.append(DownloadJob(entry_url, {}, download_type).skip("já baixado", existing_entry))
+                        continue
+                    entry_path = output_path
+                    if playlist_title:
+                        safe_title = yt_dlp.utils.sanitize_filename(playlist_title).replace('%', '%%')
+                        entry_path = output_path.replace("%(playlist_title)s", safe_title)
+                    jobs.append(DownloadJob(entry_url, self._build_options(download_type, entry_path, media_format), download_type))
+                if skipped:
+                    self.console.print(f"[yellow]{skipped} item(ns) já baixado(s) foram ignorados.[/]")
+                return jobs
+            # Não foi possível expandir: baixa a playlist inteira em um único job
+            options = self._build_options(download_type, output_path, media_format)
+            if items:
+                options['playlist_items'] = items
+            return [DownloadJob(url, options, download_type)]
+
+        if existing_file is None:
+            # Arquivos baixados antes do arquivo de downloads existir: procura pelo título
+            base_path = self.config.audio_path if download_type == 'audio' else self.config.video_path
+            title = info.get("title", url) if info else url
+            if download_type == 'audio':
+                # Considerar possíveis extensões de áudio
+                ext_list = [media_format['format'], "mp3", "m4a", "aac", "opus", "ogg", "wav", "flac"]
             else:
-                console.print("[red]Aviso: Cookies do TikTok são inválidos ou expiraram! Você pode não conseguir baixar vídeos privados.[/]")
-            time.sleep(1)
-        
-        # Usar qualidade pré-configurada ao invés de mostrar seletor
-        video_format = self._get_video_format_config()
-        
-        clear_screen()
-        console.print(f"[{self.config.theme_color}]Usando configuração de vídeo:[/] {self.config.default_video_quality}")
-        time.sleep(1)
-        
-        if not self.is_valid_url(url):
-            console.print("[red]URL inválida! Retornando ao menu...[/]")
-            time.sleep(2)
-            return
-            console.print("[red]URL inválida! Retornando ao menu...[/]")
-            time.sleep(2)
-            return
-        output_path = self._build_output_path(self.config.video_path)
-        if not self._validate_and_feedback(self.config.video_path, context="DownloadVideo", action="video download"):
-            return
-        # Obter título antes do download
-        title = self.get_title_from_url(url)
-        # Verificar se arquivo já existe
-        ext_list = ["mp4", "mkv", "webm"]
-        real_output_path = output_path
-        if "%(uploader)s" in real_output_path or "%(playlist_title)s" in real_output_path:
-            real_output_path = self.config.video_path  # fallback para pasta base
-        existing_file = self._file_exists(real_output_path, title, ext_list)
+                ext_list = ["mp4", "mkv", "webm"]
+            # Substituir variáveis do yt-dlp por valores reais para checar existência
+            real_output_path = output_path
+            if "%(uploader)s" in real_output_path or "%(playlist_title)s" in real_output_path:
+                real_output_path = base_path  # fallback para pasta base
+            existing_file = self._file_exists(real_output_path, title, ext_list)
         if existing_file:
-            if not self._interactive_overwrite(existing_file):
-                console.print("[yellow]Download cancelado pelo usuário.[/]")
-                time.sleep(2)
-                return
-        options = self._build_video_options(output_path, video_format)
+            if not self._should_overwrite(existing_file):
+                self.console.print(f"[yellow]Download ignorado, arquivo já existe:[/] {existing_file}")
+                self._pause(2)
+                return [DownloadJob(url, {}, download_type).skip("arquivo já existe", existing_file)]
+            # Sobrescrever: o yt-dlp não pode pular o item por já estar no arquivo
+            archive.remove(key)
+        options = self._build_options(download_type, output_path, media_format)
+        if existing_file:
+            options['overwrites'] = True
+        if info is not None and not formats_fresh(info):
+            # O título em cache serviu para a checagem, mas as URLs de formato expiraram:
+            # o próprio download fará a (única) extração
+            info = None
+        job = DownloadJob(url, options, download_type, info=info)
+        # A extração feita aqui conta no span "extraction" do job, somada à do download
+        job.spans["extraction"] = extraction_time
+        return [job]
+
+    def _parse_playlist_items(self, spec: str, count: int) -> List[int]:
+        """
+        Converte uma seleção no formato do yt-dlp (ex: 1,3,5-7) em índices (base 1).
+        """
+        indices = []
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                if "-" in part:
+                    start, end = part.split("-", 1)
+                    start = int(start) if start.strip() else 1
+                    end = int(end) if end.strip() else count
+                    indices.extend(range(start, end + 1))
+                else:
+                    indices.append(int(part))
+            except ValueError:
+                self.logger.log(f"Item de playlist ignorado: {part}", "WARNING", context="Playlist")
+        result = []
+        for index in indices:
+            if 1 <= index <= count and index not in result:
+                result.append(index)
+        return result
+
+    def _expand_playlist(self, url: str, playlist_items: str = None):
+        """
+        Lista os itens de uma playlist sem baixá-los, para que cada item vire um job.
+        Retorna [(url_do_item, título_da_playlist, chave)] ou None se a extração falhar.
+        """
+        opts = {"quiet": True, "no_warnings": True, "extract_flat": True, "skip_download": True}
+        if self.config.proxy_url:
+            opts['proxy'] = self.config.proxy_url
+        cookiefile = self.config.cookies.netscape_file()
+        if cookiefile:
+            opts['cookiefile'] = cookiefile
+        try:
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+        except Exception as e:
+            self.logger.log(f"Falha ao listar itens da playlist: {e}", "ERROR", context="Playlist", exc=e)
+            return None
+        entries = list(info.get("entries") or [])
+        if not entries:
+            return None
         if playlist_items:
-            options['playlist_items'] = playlist_items
+            selected = [entries[i - 1] for i in self._parse_playlist_items(playlist_items, len(entries))]
         else:
-            playlist_items_from_url = self.handle_playlist(url)
-            if playlist_items_from_url:
-                options['playlist_items'] = playlist_items_from_url
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        ) as progress:
-            self.progress = progress
-            self.current_task = progress.add_task(
-                f"[{self.config.theme_color}]Baixando...", 
-                total=100
-            )
-            success, result = self._process_download(url, options, 'video')
-            if success:
-                progress.update(self.current_task, description="[green]Download concluído!")
-                self.logger.log(f"Download de vídeo concluído: {result}")
-                console.print(f"\n[bold green]✓[/] Baixado: {result}")
-            else:
-                progress.update(self.current_task, description="[red]Erro no download!")
-                self.logger.log(f"Erro no download de vídeo: {result}", "ERROR")
-                console.print(f"\n[red]Erro:[/] {result}")
-        time.sleep(2)
+            selected = entries
+        playlist_title = info.get("title")
+        result = []
+        for entry in selected:
+            if not entry:
+                continue
+            entry_url = entry.get("webpage_url") or entry.get("url")
+            if entry_url:
+                result.append((entry_url, playlist_title, info_cache_key(entry) or url_cache_key(entry_url)))
+        return result
+
+    def _get_executor(self):
+        """
+        Retorna o pool de downloads, recriando-o se o limite de downloads simultâneos mudou.
+        """
+        workers = self.config.max_concurrent_downloads
+        with self._executor_lock:
+            if self.executor is None or self._executor_workers != workers:
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download")
+                self._executor_workers = workers
+            return self.executor
+
+    def _run_download_jobs(self, jobs: List[DownloadJob], download_type: str):
+        """
+        Envia os jobs para o pool de downloads e acompanha a conclusão de cada um
+        no painel ao vivo (uma linha por job ativo e um resumo geral). O som de
+        notificação toca uma vez, ao fim do lote.
+        """
+        type_label = "áudio" if download_type == 'audio' else "vídeo"
+        jobs = [job for job in jobs if job.status == "queued"]
+        executor = self._get_executor()
+        dashboard = DownloadDashboard(
+            jobs, self.console,
+            f"Baixando {len(jobs)} {'itens' if len(jobs) > 1 else 'item'} ({self._executor_workers} simultâneos)",
+            theme_color=self.config.theme_color,
+            interval=self.PROGRESS_INTERVAL
+        )
+        with dashboard:
+            self.download_queue = [job.url for job in jobs]
+            futures = {executor.submit(self._process_download, job): job for job in jobs}
+            try:
+                for future in as_completed(futures):
+                    job = futures[future]
+                    future.result()
+                    if job.url in self.download_queue:
+                        self.download_queue.remove(job.url)
+                    if job.success:
+                        self.logger.log(f"Download de {type_label} concluído: {job.result} ({job.summary()})")
+                        dashboard.console.print(f"[bold green]✓[/] Baixado: {job.result} [dim]({job.summary()})[/]")
+                    else:
+                        self.logger.log(f"Erro no download de {type_label}: {job.result}", "ERROR")
+                        dashboard.console.print(f"[red]Erro:[/] {job.result}")
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                self.download_queue = []
+                raise
+        if any(job.success for job in jobs):
+            self.play_notification()
 
 class Menu:
     def __init__(self):
@@ -1548,11 +4604,14 @@ class Menu:
         confirm = questionary.confirm(
             "Deseja atualizar todas as dependências (yt-dlp, ffmpeg, etc)?",
             default=True,
-            style=custom_style
+            style=custom_style()
         ).ask()
         if confirm:
-            self.dependency_manager.update_all_dependencies()
-            self.console.print("[green]Dependências atualizadas![/]")
+            steps = self.dependency_manager.update_all_dependencies()
+            if all(step["ok"] for step in steps):
+                self.console.print("[green]Dependências atualizadas![/]")
+            else:
+                self.console.print("[yellow]Algumas dependências não foram atualizadas (veja o log).[/]")
             time.sleep(2)
         else:
             self.console.print("[yellow]Atualização cancelada.[/]")
@@ -1585,24 +4644,16 @@ class Menu:
                     {"name": "Vídeo", "value": "2"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
-            if choice == "1":
-                url = questionary.text(
-                    "Digite a URL (ou pressione Enter para voltar):",
-                    style=custom_style
-                ).ask()
-                if not url or not url.strip():
-                    continue
-                self.downloader.download_audio(url)
-            elif choice == "2":
+            if choice in ("1", "2"):
                 url = questionary.text(
-                    "Digite a URL (ou pressione Enter para voltar):",
-                    style=custom_style
+                    "Digite uma ou mais URLs separadas por espaço (ou pressione Enter para voltar):",
+                    style=custom_style()
                 ).ask()
                 if not url or not url.strip():
                     continue
-                self.downloader.download_video(url)
+                self.downloader.download_urls(url.split(), 'audio' if choice == "1" else 'video')
             elif choice == "back":
                 break
 
@@ -1621,11 +4672,14 @@ class Menu:
                     {"name": "Atualizar script do GitHub", "value": "script"},
                     {"name": "Voltar", "value": "back"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "deps":
-                self.dependency_manager.update_all_dependencies()
-                self.console.print("[green]Dependências atualizadas![/]")
+                steps = self.dependency_manager.update_all_dependencies()
+                if all(step["ok"] for step in steps):
+                    self.console.print("[green]Dependências atualizadas![/]")
+                else:
+                    self.console.print("[yellow]Algumas dependências não foram atualizadas (veja o log).[/]")
                 time.sleep(2)
             elif choice == "script":
                 self.update_script_from_github()
@@ -1685,7 +4739,7 @@ class Menu:
                     {"name": "Configurações", "value": "3"},
                     {"name": "Sair", "value": "5"}
                 ],
-                style=custom_style
+                style=custom_style()
             ).ask()
             if choice == "1":
                 self.download_menu()
@@ -1696,6 +4750,7 @@ class Menu:
             elif choice == "3":
                 self.config.configure_paths()
             elif choice == "5":
+                self.downloader.shutdown()
                 console.print(f"\n[{self.config.theme_color}]Obrigado por usar o YouTube Downloader![/]")
                 break
             elif choice == "6":
@@ -1711,7 +4766,7 @@ class Menu:
             ))
             url = questionary.text(
                 "Digite a URL da playlist (ou deixe em branco para voltar):",
-                style=custom_style
+                style=custom_style()
             ).ask()
             if not url or not url.strip():
                 return
@@ -1731,7 +4786,7 @@ class Menu:
                 selected_ids = questionary.checkbox(
                     "Selecione itens para download (espaço para selecionar, Enter para confirmar):",
                     choices=choices,
-                    style=custom_style
+                    style=custom_style()
                 ).ask()
                 if not selected_ids or "back" in selected_ids:
                     continue
@@ -1742,7 +4797,7 @@ class Menu:
                         {"name": "Vídeo", "value": "video"},
                         {"name": "Voltar", "value": "back"}
                     ],
-                    style=custom_style
+                    style=custom_style()
                 ).ask()
                 if download_type == "back":
                     continue
@@ -1759,6 +4814,359 @@ class Menu:
                 continue
 # --- Fim da classe Menu ---
 
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="YouTube Downloader. Sem argumentos, abre o menu interativo."
+    )
+    parser.add_argument("--audio", nargs="*", metavar="URL",
+                        help="baixa as URLs como áudio (com --batch, define o tipo das URLs do arquivo)")
+    parser.add_argument("--video", nargs="*", metavar="URL",
+                        help="baixa as URLs como vídeo (com --batch, define o tipo das URLs do arquivo)")
+    parser.add_argument("--batch", metavar="ARQUIVO",
+                        help="arquivo com URLs, uma por linha ('-' lê da entrada padrão)")
+    parser.add_argument("--jobs", type=int, metavar="N",
+                        help="downloads simultâneos (1-8, padrão: valor do config.json)")
+    parser.add_argument("--on-exists", choices=["skip", "overwrite"], default="skip",
+                        help="o que fazer quando o arquivo já foi baixado (padrão: skip)")
+    parser.add_argument("--json", action="store_true",
+                        help="escreve o resultado em JSON na saída padrão")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="mede o tempo até o primeiro menu e mostra os imports mais caros")
+    parser.add_argument("--benchmark-library", type=int, metavar="N",
+                        help="gera N arquivos MP3 de teste e mede a indexação da biblioteca com 1 a 16 threads")
+    parser.add_argument("--benchmark-downloads", type=int, metavar="N",
+                        help="baixa N itens de áudio e N de vídeo de um servidor local (sem rede) com 1, 2 e 4 downloads simultâneos")
+    return parser
+
+_STARTUP_PROFILE_CODE = """
+import importlib.util, sys, time
+t0 = time.perf_counter()
+spec = importlib.util.spec_from_file_location("ytd_startup_profile", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+t1 = time.perf_counter()
+menu = module.Menu()
+menu.dependency_manager.check_all_dependencies()
+module.custom_style()
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t0)
+"""
+
+def startup_profile(top: int = 20) -> int:
+    """
+    Reexecuta o script em outro interpretador com -X importtime até o ponto em que o
+    menu principal seria desenhado, e mostra os imports mais caros.
+    """
+    from rich.table import Table
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _STARTUP_PROFILE_CODE, os.path.abspath(__file__)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    try:
+        module_time, menu_time = (float(v) for v in result.stdout.split()[-2:])
+    except ValueError:
+        console.print(f"[red]Falha ao medir a inicialização:[/]\n{result.stderr[-2000:]}")
+        return 1
+    imports = []
+    for line in result.stderr.splitlines():
+        # Formato: "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            imports.append((name.rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    # Só os imports de primeiro nível (sem indentação extra) somam o tempo total
+    top_level = [item for item in imports if not item[0].startswith("  ")]
+    table = Table(title="Imports mais caros (cumulativo)", border_style="cyan")
+    table.add_column("Módulo")
+    table.add_column("Próprio (ms)", justify="right")
+    table.add_column("Cumulativo (ms)", justify="right")
+    for name, self_us, cumulative_us in sorted(top_level, key=lambda item: item[2], reverse=True)[:top]:
+        table.add_row(name.strip(), f"{self_us / 1000:.1f}", f"{cumulative_us / 1000:.1f}")
+    console.print(table)
+    console.print(
+        f"Imports: {len(imports)} módulos, {sum(item[2] for item in top_level) / 1000:.1f} ms | "
+        f"Script carregado: {module_time * 1000:.1f} ms | Até o primeiro menu: {menu_time * 1000:.1f} ms"
+    )
+    return 0
+
+def _write_test_mp3(path: str, index: int):
+    """
+    MP3 mínimo válido (quadros MPEG-1 Layer III silenciosos, ~2 s) com tags ID3.
+    """
+    from mutagen.easyid3 import EasyID3
+    from mutagen.id3 import ID3
+    # 128 kbps, 44,1 kHz: 417 bytes por quadro, 1152 amostras
+    frame = b"\xff\xfb\x90\x00" + b"\x00" * 413
+    with open(path, "wb") as f:
+        f.write(frame * 77)
+    ID3().save(path)
+    tags = EasyID3(path)
+    tags["title"] = f"Faixa {index}"
+    tags["artist"] = f"Artista {index % 25}"
+    tags["album"] = f"Álbum {index % 60}"
+    tags.save()
+
+def benchmark_library(count: int, worker_counts=(1, 2, 4, 8, 16)) -> int:
+    """
+    Gera um acervo de teste em uma pasta temporária e mede, para cada número de threads,
+    a varredura da pasta e a leitura das tags, além da atualização incremental sem mudanças.
+    """
+    import tempfile
+    from rich.table import Table
+    config = DownloaderConfig()
+    with tempfile.TemporaryDirectory(prefix="ytd-library-") as temp_dir:
+        root = os.path.join(temp_dir, "music")
+        with console.status(f"Gerando {count} arquivos de teste..."):
+            for index in range(count):
+                folder = os.path.join(root, f"artista{index % 25:02d}", f"album{index % 60:02d}")
+                os.makedirs(folder, exist_ok=True)
+                _write_test_mp3(os.path.join(folder, f"faixa{index:05d}.mp3"), index)
+        table = Table(title=f"Indexação da biblioteca ({count} arquivos)", border_style="cyan")
+        for column in ("Threads", "Varredura (s)", "Tags (s)", "Arquivos/s", "Incremental (ms)"):
+            table.add_column(column, justify="right")
+        for workers in worker_counts:
+            library = MusicLibrary(config, db_path=os.path.join(temp_dir, f"library-{workers}.db"))
+            started = time.perf_counter()
+            library.refresh(root, read_tags=False)
+            scanned = time.perf_counter()
+            library.read_pending_tags(root, workers=workers)
+            tagged = time.perf_counter()
+            library.refresh(root)
+            incremental = time.perf_counter() - tagged
+            tag_time = tagged - scanned
+            table.add_row(
+                str(workers), f"{scanned - started:.2f}", f"{tag_time:.2f}",
+                f"{count / tag_time:.0f}" if tag_time else "-", f"{incremental * 1000:.1f}"
+            )
+        console.print(table)
+        console.print("[dim]Os arquivos acabaram de ser gravados e estão no cache do sistema; "
+                      "em armazenamento lento (ex: /sdcard) o ganho com mais threads é maior.[/]")
+    return 0
+
+_BENCHMARK_AUDIO_PAGE = """<html><head><title>Faixa {index:03d}</title>
+<meta property="og:image" content="{base_url}/media/thumb.jpg"></head><body>
+<audio controls><source src="{base_url}/media/track.m4a" type='audio/mp4; codecs="mp4a.40.2"'></audio>
+</body></html>
+"""
+
+_BENCHMARK_VIDEO_PAGE = """<html><head><title>Clipe {index:03d}</title></head><body>
+<video controls poster="{base_url}/media/thumb.jpg">
+<source src="{base_url}/media/dash/manifest.mpd" type="application/dash+xml">
+</video>
+</body></html>
+"""
+
+def _write_benchmark_site(root: str, items: int, base_url: str):
+    """
+    Gera com o ffmpeg a mídia de teste (áudio AAC, vídeo em DASH e uma miniatura)
+    e uma página HTML5 por item, com URLs absolutas para base_url, que o extrator
+    genérico do yt-dlp reconhece. O DASH tem vídeo e áudio separados, como no
+    YouTube, para o preset de vídeo passar pelos fragmentos e pela junção.
+    """
+    media = os.path.join(root, "media")
+    os.makedirs(os.path.join(media, "dash"), exist_ok=True)
+    ffmpeg = ["ffmpeg", "-y", "-loglevel", "error"]
+    commands = [
+        ffmpeg + ["-f", "lavfi", "-i", "sine=frequency=440:duration=30", "-c:a", "aac", "-b:a", "128k",
+                  os.path.join(media, "track.m4a")],
+        ffmpeg + ["-f", "lavfi", "-i", "testsrc=size=640x360:rate=25:duration=30",
+                  "-f", "lavfi", "-i", "sine=frequency=440:duration=30",
+                  "-map", "0:v", "-map", "1:a", "-c:v", "mpeg4", "-q:v", "5", "-c:a", "aac", "-b:a", "128k",
+                  "-f", "dash", "-seg_duration", "5", "-use_template", "1", "-use_timeline", "0",
+                  "-adaptation_sets", "id=0,streams=v id=1,streams=a", os.path.join(media, "dash", "manifest.mpd")],
+        ffmpeg + ["-f", "lavfi", "-i", "color=c=navy:s=320x180", "-frames:v", "1", os.path.join(media, "thumb.jpg")],
+    ]
+    for command in commands:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    for download_type, page in (("audio", _BENCHMARK_AUDIO_PAGE), ("video", _BENCHMARK_VIDEO_PAGE)):
+        os.makedirs(os.path.join(root, download_type))
+        for index in range(items):
+            with open(os.path.join(root, download_type, f"item{index:03d}.html"), "w", encoding="utf-8") as f:
+                f.write(page.format(index=index, base_url=base_url))
+
+def benchmark_downloads(items: int, worker_counts=(1, 2, 4)) -> int:
+    """
+    Mede o pipeline de download sem acessar a rede: um servidor HTTP local serve mídia
+    gerada pelo ffmpeg em páginas HTML5, e cada item passa por Downloader._process_download
+    com as opções reais de áudio e vídeo. Para cada número de downloads simultâneos mostra
+    itens/s, MB/s, latência média da extração e tempo médio de pós-processamento.
+    """
+    import http.server
+    from functools import partial
+    from rich.table import Table
+    if not shutil.which("ffmpeg"):
+        console.print("[red]O benchmark de downloads precisa do ffmpeg (mídia de teste e pós-processamento).[/]")
+        return 1
+
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    config = DownloaderConfig()
+    # Nada do benchmark vai para os caches, o arquivo de downloads ou as pastas do usuário
+    config.metadata_cache_ttl_hours = 0
+    config.notification_sound = False
+    config.auto_delete_temp = False
+    config.metrics_enabled = False
+    config.metrics_prometheus_file = ""
+    config.proxy_url = ""
+    downloader = Downloader(config)
+    downloader.interactive = False
+    presets = [
+        ("audio", {"format": config.default_audio_format, "quality": config.default_audio_quality}),
+        ("video", downloader._get_video_format_config()),
+    ]
+    with tempfile.TemporaryDirectory(prefix="ytd-downloads-") as temp_dir:
+        site = os.path.join(temp_dir, "site")
+        os.makedirs(site)
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=site))
+        threading.Thread(target=server.serve_forever, name="benchmark-http", daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        with console.status("Gerando mídia de teste com o ffmpeg..."):
+            try:
+                _write_benchmark_site(site, items, base_url)
+            except subprocess.CalledProcessError as e:
+                server.shutdown()
+                console.print(f"[red]Falha ao gerar a mídia de teste:[/] {e.stderr.decode(errors='replace')[-500:]}")
+                return 1
+        table = Table(title=f"Pipeline de download ({items} itens por preset, servidor local)", border_style="cyan")
+        for column in ("Preset", "Simultâneos", "Itens/s", "MB/s", "Extração (ms)", "Pós-proc. (s)", "Falhas"):
+            table.add_column(column, justify="right")
+        errors = []
+        try:
+            for download_type, media_format in presets:
+                for workers in worker_counts:
+                    name = f"{download_type}-{workers}"
+                    output_path = os.path.join(temp_dir, name)
+                    downloader.archives = {
+                        kind: DownloadArchive(config, kind, db_path=os.path.join(temp_dir, f"archive-{name}.db"))
+                        for kind in ('audio', 'video')
+                    }
+                    config.max_concurrent_downloads = workers
+                    jobs = [
+                        DownloadJob(f"{base_url}/{download_type}/item{index:03d}.html",
+                                    downloader._build_options(download_type, output_path, media_format), download_type)
+                        for index in range(items)
+                    ]
+                    extraction = {}
+
+                    def run(job):
+                        started = time.perf_counter()
+                        job.info = downloader._extract_info(job.url)
+                        extraction[job.url] = time.perf_counter() - started
+                        return downloader._process_download(job)
+
+                    with console.status(f"{download_type}: {items} itens, {workers} simultâneo(s)..."):
+                        started = time.perf_counter()
+                        list(downloader._get_executor().map(run, jobs))
+                        wall = time.perf_counter() - started
+                    done = [job for job in jobs if job.success]
+                    errors.extend(job.result for job in jobs if not job.success)
+                    postprocessing = [job.finished_at - job.download_finished_at for job in done if job.download_finished_at]
+                    table.add_row(
+                        "Áudio" if download_type == 'audio' else "Vídeo",
+                        str(workers),
+                        f"{len(done) / wall:.2f}",
+                        f"{sum(job.downloaded_bytes for job in done) / (1024 * 1024) / wall:.2f}",
+                        f"{sum(extraction.values()) / len(extraction) * 1000:.0f}",
+                        f"{sum(postprocessing) / len(postprocessing):.2f}" if postprocessing else "-",
+                        str(len(jobs) - len(done)),
+                    )
+        finally:
+            server.shutdown()
+            downloader.executor.shutdown(wait=False)
+        console.print(table)
+        if errors:
+            console.print(f"[red]Primeira falha:[/] {errors[0]}")
+    return 1 if errors else 0
+
+def _read_batch_file(path: str) -> List[str]:
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(os.path.expanduser(path), "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.extend(line.split())
+    return urls
+
+def run_headless(args) -> int:
+    """
+    Executa downloads sem nenhuma pergunta interativa (cron, scripts, pipelines).
+    Retorna o código de saída: 0 sucesso, 1 algum download falhou, 2 erro de uso.
+    """
+    config = DownloaderConfig()
+    if args.jobs:
+        config.set_max_concurrent_downloads(args.jobs)
+    downloader = Downloader(config)
+    downloader.interactive = False
+    downloader.on_exists = args.on_exists
+    if args.json:
+        # A saída padrão fica reservada para o JSON
+        downloader.console = Console(stderr=True)
+        config.logger.console = downloader.console
+
+    urls_by_type = {'audio': list(args.audio or []), 'video': list(args.video or [])}
+    if args.batch:
+        batch_type = 'video' if args.video is not None and args.audio is None else 'audio'
+        try:
+            urls_by_type[batch_type].extend(_read_batch_file(args.batch))
+        except OSError as e:
+            downloader.console.print(f"[red]Não foi possível ler o arquivo de URLs:[/] {e}")
+            return 2
+
+    jobs: List[DownloadJob] = []
+    try:
+        for download_type in ('audio', 'video'):
+            if urls_by_type[download_type]:
+                jobs.extend(downloader.download_urls(urls_by_type[download_type], download_type))
+    except KeyboardInterrupt:
+        downloader.console.print("[yellow]Interrompido.[/]")
+        return 130
+    finally:
+        downloader.executor.shutdown(wait=False)
+
+    failed = [job for job in jobs if not job.success]
+    if args.json:
+        print(json.dumps({
+            "jobs": [job.to_dict() for job in jobs],
+            "succeeded": sum(1 for job in jobs if job.success and job.status != "skipped"),
+            "skipped": sum(1 for job in jobs if job.status == "skipped"),
+            "failed": len(failed),
+        }, ensure_ascii=False))
+    if not jobs:
+        return 2
+    return 1 if failed else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.startup_profile:
+        return startup_profile()
+    for option, value in (("--benchmark-library", args.benchmark_library), ("--benchmark-downloads", args.benchmark_downloads)):
+        if value is not None and value < 1:
+            parser.error(f"{option} exige N maior ou igual a 1")
+    if args.benchmark_library is not None:
+        return benchmark_library(args.benchmark_library)
+    if args.benchmark_downloads is not None:
+        return benchmark_downloads(args.benchmark_downloads)
+    if args.audio is None and args.video is None and not args.batch:
+        if args.jobs or args.json:
+            parser.error("--jobs e --json exigem --audio, --video ou --batch")
+        menu = Menu()
+        menu.main_menu()
+        return 0
+    if not (args.audio or args.video or args.batch):
+        parser.error("informe ao menos uma URL em --audio/--video ou use --batch")
+    return run_headless(args)
+
 if __name__ == "__main__":
-    menu = Menu()
-    menu.main_menu()
+    sys.exit(main())